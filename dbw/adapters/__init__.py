@@ -4,7 +4,9 @@ database. All other ORM modules should be database agnostic.
 """
 __author__ = "Victor Varvariuc <victor.varvariuc@gmail.com>"
 
+import array
 import pprint
+import functools
 
 import dbw
 
@@ -39,50 +41,169 @@ class Column():
         return '%s(%s)' % (name, ', '.join('%s= %s' % attr for attr in attrs.items()))
 
 
+class PlanNode():
+    """A step of a query plan which reads a table.
+    """
+    def __init__(self, table, index=None, full_scan=True, rows=None, detail=''):
+        self.table = table  # name of the read table
+        self.index = index  # name of the used index or None
+        self.full_scan = full_scan  # whether all rows of the table (or of the index) are read
+        self.rows = rows  # estimated number of rows, None if not known
+        self.detail = detail  # description of the step given by the db
+
+    def __repr__(self):
+        return '%s(%r, index=%r, full_scan=%r, rows=%r)' % (
+            self.__class__.__name__, self.table, self.index, self.full_scan, self.rows)
+
+
+class QueryPlan():
+    """Plan of a query parsed from the db specific EXPLAIN output.
+    """
+    def __init__(self, query, nodes, rows=None, raw=None):
+        """
+        @param query: the explained query
+        @param nodes: list of PlanNode instances, one for each read of a table
+        @param rows: estimated number of rows returned by the query, None if not known
+        @param raw: the plan as returned by the db
+        """
+        self.query = query
+        self.nodes = nodes
+        self.rows = rows
+        self.raw = raw
+
+    @property
+    def tables(self):
+        """Names of the read tables.
+        """
+        tables = []
+        for node in self.nodes:
+            if node.table not in tables:
+                tables.append(node.table)
+        return tables
+
+    @property
+    def full_scans(self):
+        """Nodes which read whole tables (or indexes).
+        """
+        return [node for node in self.nodes if node.full_scan]
+
+    def uses_index(self, table=None):
+        """Check if rows of the table are looked up using an index.
+        @param table: a model or table name; if not given - check all read tables
+        """
+        nodes = [node for node in self.nodes if table is None or node.table == str(table)]
+        return bool(nodes) and all(node.index and not node.full_scan for node in nodes)
+
+    def __repr__(self):
+        return pprint.pformat(self.nodes)
+
+
 class Rows():
     """The object keeps results of a SELECT and provides methods for convenient access.
     """
-    def __init__(self, db, query, fields):
+    def __init__(self, db, query, fields, params=(), layout=None):
         """
         @param db: adapter thrught which the query was made
         @param query: the SELECT sql query performed
         @param fields: list of queried fields
+        @param params: parameters for the placeholders in the query
+        @param layout: `_layout` of rows of a query with the same fields, to reuse what was
+            computed from them
         """
         self.db = db
         self.query = query
+        self.params = params
         self.values = []
         self.fields = tuple(fields)
-        self._fields_str = tuple(str(field) for field in fields)
-        # {field_str: field_order}
-        self._fields_order = dict((field_str, i) for i, field_str in enumerate(self._fields_str))
+        if layout is None:
+            fields_str = tuple(str(field) for field in fields)
+            # {field_str: field_order}
+            fields_order = dict((field_str, i) for i, field_str in enumerate(fields_str))
+            layout = (fields_str, fields_order, self._get_decoders())
+        # what is computed from the fields, shared with rows of queries with the same fields
+        self._layout = layout
+        self._fields_str, self._fields_order, self._decoders = layout
+        # {id(field): field_order} for looking up fields without rendering them; a model
+        # attribute gives a new FieldExpression each time, so the model fields are indexed too
+        self._fields_index = {}
+        for i, field in enumerate(self.fields):
+            self._fields_index[id(field)] = i
+            if isinstance(field, dbw.FieldExpression):
+                self._fields_index[id(field.left)] = i
+        self._has_decoders = any(self._decoders)
+
+    def _get_decoders(self):
+        """Find out once per query how to decode values of each column.
+        @return: tuple with a decode function or None for each of the fields
+        """
+        decoders = []
+        for field in self.fields:
+            decoder = None
+            if isinstance(field, dbw.FieldExpression):
+                column = field.left.column
+                if isinstance(column, Column):
+                    decode_func = getattr(self.db, '_decode_' + column.type.upper(), None)
+                    if decode_func:
+                        decoder = functools.partial(decode_func, column=column)
+            decoders.append(decoder)
+        return tuple(decoders)
 
     def execute_query(self):
         """Execute the SELECT query and process results fetched from the DB.
         Decode values to model fields representation.
         """
-        cursor = self.db.execute(self.query)
-        rows = []
-        for row in cursor.fetchall():
-            new_row = []
-            for field_no, field in enumerate(self.fields):
-                value = row[field_no]
-                if value is not None and isinstance(field, dbw.FieldExpression):
-                    column = field.left.column
-                    if isinstance(column, Column):
-                        decode_func = getattr(self.db, '_decode_' + column.type.upper(), None)
-                        if decode_func:
-                            value = decode_func(value, column)
-                new_row.append(value)
-            rows.append(new_row)
-        self.values = rows
+        cursor = self.db.execute(self.query, *self.params)
+        self.values = [self._decode_row(row) for row in cursor.fetchall()]
+        if cursor.rowcount < 0:  # the driver did not tell the number of rows
+            self.db._stats.add_rows(self.query, len(self.values))
+
+    def _decode_row(self, row):
+        """Decode values of a fetched row.
+        """
+        if not self._has_decoders:
+            return list(row)
+        return [value if decoder is None or value is None else decoder(value)
+                for decoder, value in zip(self._decoders, row)]
+
+    def _get_field_no(self, field):
+        """Get position of a queried field.
+        @param field: field instance or column number
+        """
+        if isinstance(field, int):
+            return field
+        # the indexed fields are referenced by `self.fields`, so their ids are not reused
+        field_no = self._fields_index.get(id(field))
+        if field_no is None and isinstance(field, dbw.FieldExpression):
+            field_no = self._fields_index.get(id(field.left))
+        if field_no is None:  # an equal expression, but another instance
+            field_no = self._fields_order[str(field)]
+        return field_no
 
     def value(self, row_no, field):
         """Get a value.
         @param rowNo: row number
         @param field: field instance or column number
         """
-        field_no = field if isinstance(field, int) else self._fields_order[str(field)]
-        return self.values[row_no][field_no]
+        return self.values[row_no][self._get_field_no(field)]
+
+    def column(self, field):
+        """Get all values of a column.
+        @param field: field instance or column number
+        """
+        field_no = self._get_field_no(field)
+        return [row[field_no] for row in self]
+
+    def columns(self, *fields):
+        """Get all values of several columns.
+        @param fields: field instances or column numbers; all columns if not given
+        @return: list with a sequence of values for each of the fields
+        """
+        field_nos = [self._get_field_no(field) for field in fields or range(len(self.fields))]
+        columns = [[] for _ in field_nos]
+        for row in self:
+            for column, field_no in zip(columns, field_nos):
+                column.append(row[field_no])
+        return columns
 
     def __len__(self):
         return len(self.values)
@@ -101,11 +222,162 @@ class Rows():
         """Iterator of the result which return row by row in form
         {'field1_name': field1_value, 'field2_name': field2_value, ...}
         """
-        for row in self.values:
+        for row in self:
             yield {self._fields_str[i]: value for i, value in enumerate(row)}
 
 
+class StreamingRows(Rows):
+    """Results of a SELECT which are fetched from the DB and decoded in batches while being
+    iterated, so that memory use does not depend on the number of rows. The rows can be iterated
+    only once and cannot be accessed by index.
+    """
+    def __init__(self, db, query, fields, params=(), batch_size=1000, layout=None):
+        """
+        @param batch_size: number of rows fetched at once
+        """
+        super().__init__(db, query, fields, params, layout)
+        self.batch_size = batch_size
+        self._cursor = None
+
+    def execute_query(self):
+        """Execute the SELECT query. The results are fetched when iterating.
+        """
+        self._cursor = self.db._execute_stream(self.query, self.params, self.batch_size)
+
+    def __iter__(self):
+        cursor, self._cursor = self._cursor, None
+        if cursor is None:
+            raise dbw.QueryError('The rows were already iterated or the query was not executed.')
+        rows_count_known = cursor.rowcount >= 0
+        rows_count = 0
+        try:
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                rows_count += len(rows)
+                for row in rows:
+                    yield self._decode_row(row)
+        finally:
+            self.db._close_stream(cursor)
+            if not rows_count_known:
+                self.db._stats.add_rows(self.query, rows_count)
+
+    def _random_access(self, *args):
+        raise dbw.QueryError('Streamed rows can be only iterated.')
+
+    value = __getitem__ = _random_access
+
+    def __len__(self):
+        raise TypeError('Number of streamed rows is not known.')
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self.query)
+
+
+class ColumnarRows(Rows):
+    """Results of a SELECT kept by columns: one sequence of values for each queried field.
+    Values of INT and BOOL columns are packed into `array.array` (BOOL as 0 and 1), or into NumPy
+    arrays if NumPy is installed. Columns which contain NULLs, and other columns, are lists.
+    """
+    _FETCH_SIZE = 10000  # number of rows fetched at once
+
+    def __init__(self, db, query, fields, params=(), scaled_decimals=False, layout=None):
+        """
+        @param scaled_decimals: keep values of DECIMAL columns, which the db stores as integers
+            scaled by 10 ** scale (Sqlite), as such integers packed like INT columns; their scales
+            are in `scales`
+        """
+        super().__init__(db, query, fields, params, layout)
+        self._columns = []
+        self.scales = {}  # {field_no: scale} for DECIMAL columns kept as scaled integers
+        self._typecodes = []  # array typecode or None for each column
+        decoders = list(self._decoders)
+        for field_no, field in enumerate(self.fields):
+            typecode = None
+            if isinstance(field, dbw.FieldExpression) and isinstance(field.left.column, Column):
+                column = field.left.column
+                column_type = column.type.upper()
+                if column_type == 'INT':
+                    typecode = 'q'
+                elif column_type == 'BOOL':
+                    typecode = 'B'
+                elif column_type == 'DECIMAL' and scaled_decimals and db._scaled_decimals:
+                    typecode = 'q'
+                    self.scales[field_no] = column.scale
+                    decoders[field_no] = None
+            self._typecodes.append(typecode)
+        self._decoders = tuple(decoders)
+
+    def execute_query(self):
+        """Execute the SELECT query, fetch the results in batches and distribute the values to
+        the columns.
+        """
+        cursor = self.db.execute(self.query, *self.params)
+        columns = [array.array(typecode) if typecode else [] for typecode in self._typecodes]
+        while True:
+            rows = cursor.fetchmany(self._FETCH_SIZE)
+            if not rows:
+                break
+            for field_no, values in enumerate(zip(*rows)):
+                column = columns[field_no]
+                decoder = self._decoders[field_no]
+                if isinstance(column, array.array):
+                    column_length = len(column)
+                    try:
+                        column.extend(values)
+                        continue
+                    except (TypeError, OverflowError):  # a NULL or a too big integer
+                        del column[column_length:]
+                        column = columns[field_no] = [
+                            value if decoder is None else decoder(value) for value in column]
+                if decoder is None:
+                    column.extend(values)
+                else:
+                    column.extend(None if value is None else decoder(value) for value in values)
+        if cursor.rowcount < 0:  # the driver did not tell the number of rows
+            self.db._stats.add_rows(self.query, len(columns[0]) if columns else 0)
+
+        try:
+            import numpy
+        except ImportError:
+            pass
+        else:
+            for field_no, column in enumerate(columns):
+                if isinstance(column, array.array):
+                    columns[field_no] = numpy.frombuffer(
+                        column, numpy.bool_ if column.typecode == 'B' else numpy.int64)
+        self._columns = columns
+
+    def column(self, field):
+        return self._columns[self._get_field_no(field)]
+
+    def columns(self, *fields):
+        if not fields:
+            return list(self._columns)
+        return [self.column(field) for field in fields]
+
+    def value(self, row_no, field):
+        return self.column(field)[row_no]
+
+    def __len__(self):
+        return len(self._columns[0]) if self._columns else 0
+
+    def __getitem__(self, row_no):
+        return [column[row_no] for column in self._columns]
+
+    def __iter__(self):
+        return (list(row) for row in zip(*self._columns))
+
+    def __repr__(self):
+        return pprint.pformat(dict(zip(self._fields_str, self._columns)))
+
+
 from .generic import *
+from .result_cache import ResultCache
 from .sqlite import *
 from .postgresql import *
 from .mysql import *
+from .routing import *
+from .sharding import *
+from .asynchronous import *
@@ -0,0 +1,235 @@
+"""
+Asyncio interface to the database adapters.
+"""
+import time
+import asyncio
+import functools
+import contextlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import dbw
+from .postgresql import PostgreSqlAdapter, number_placeholders
+
+
+class AsyncGenericAdapter():
+    """Asyncio interface to a database adapter. Queries are rendered and executed by the wrapped
+    synchronous adapter in a worker thread dedicated to its connection, so they do not block the
+    event loop. Tasks take turns using the connection; a `transaction()` block holds it until
+    the block ends.
+    Records got through the adapter are read-only: they cannot be saved or deleted and their
+    related records are not loaded on access (use `select_related`), change them with the adapter
+    methods, e.g. `await db.update(...)`.
+    """
+    def __init__(self, db):
+        """
+        @param db: not connected synchronous adapter, e.g. SqliteAdapter(); it is connected in
+            the worker thread
+        """
+        self.db = db
+        self._executor = None
+        self._lock = asyncio.Lock()
+        # whether the current task holds the connection for a transaction block
+        self._in_transaction = contextvars.ContextVar('in_transaction', default=False)
+
+    def __str__(self):
+        return str(self.db)
+
+    async def connect(self, url, *args, **kwargs):
+        """Connect to the DB. The arguments are the same as of the synchronous adapter
+        `connect`, except that a connection pool cannot be used.
+        @return: self
+        """
+        if kwargs.get('pool_size'):
+            raise dbw.AdapterError('Asyncio adapter uses one connection in a worker thread.')
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        await self._run(self.db.connect, url, *args, **kwargs)
+        return self
+
+    async def disconnect(self):
+        await self._run(self.db.disconnect)
+        self._executor.shutdown()
+
+    async def _run(self, func, *args, **kwargs):
+        """Call a function using the connection in the worker thread, waiting while the connection
+        is held by a transaction block of another task.
+        """
+        call = functools.partial(func, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        if self._in_transaction.get():
+            return await loop.run_in_executor(self._executor, call)
+        async with self._lock:
+            return await loop.run_in_executor(self._executor, call)
+
+    def _execute(self, query, args):
+        cursor = self.db.execute(query, *args)
+        return cursor.fetchall() if cursor.description else []
+
+    async def execute(self, query, *args):
+        """Execute a query.
+        @return: list of the rows returned by the query
+        """
+        return await self._run(self._execute, query, args)
+
+    async def commit(self):
+        await self._run(self.db.commit)
+
+    async def rollback(self):
+        await self._run(self.db.rollback)
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        """Asynchronous context manager for executing several queries in one transaction, see
+        `GenericAdapter.transaction`. The task holds the connection until the block ends.
+        """
+        nested = self._in_transaction.get()
+        if not nested:
+            await self._lock.acquire()
+            token = self._in_transaction.set(True)
+        try:
+            transaction = self.db.transaction()
+            await self._run(transaction.__enter__)
+            try:
+                yield
+            except BaseException as exc:
+                # rolls back and raises the exception
+                await self._run(transaction.__exit__, type(exc), exc, exc.__traceback__)
+                raise
+            await self._run(transaction.__exit__, None, None, None)
+        finally:
+            if not nested:
+                self._in_transaction.reset(token)
+                self._lock.release()
+
+    async def select(self, *fields, **kwargs):
+        """Execute a SELECT query, see `GenericAdapter.select`. Streaming is not supported.
+        @return: Rows instance
+        """
+        if kwargs.get('stream'):
+            raise dbw.QueryError('Asyncio adapters do not stream rows.')
+        return await self._run(self.db.select, *fields, **kwargs)
+
+    async def insert(self, *fields, **kwargs):
+        return await self._run(self.db.insert, *fields, **kwargs)
+
+    async def update(self, *fields, **kwargs):
+        return await self._run(self.db.update, *fields, **kwargs)
+
+    async def delete(self, model, where, **kwargs):
+        return await self._run(self.db.delete, model, where, **kwargs)
+
+    async def _check_table(self, query_manager):
+        await self._run(query_manager.check_table, self.db)
+
+    async def _get_records(self, query_manager, where, orderby, limit, select_related):
+        """Asynchronous generator of records, see `QueryManager.get`. The records are bound to
+        this adapter and are read-only.
+        """
+        await self._check_table(query_manager)
+        fields, from_, record_fields = query_manager._get_select_args(select_related)
+        orderby = orderby or query_manager.model._meta.ordering
+        rows = await self.select(*fields, from_=from_, where=where, orderby=orderby, limit=limit)
+        for row in rows:
+            yield query_manager._make_record(self, row, record_fields)
+
+
+class AsyncPostgreSqlAdapter(AsyncGenericAdapter):
+    """Asyncio adapter for PostgreSql databases using the native asyncpg driver and a pool of its
+    connections. Queries are rendered by a PostgreSqlAdapter, which is not connected. Each query
+    is committed when executed, unless it is executed in a `transaction()` block.
+    """
+    def __init__(self, db=None):
+        super().__init__(db or PostgreSqlAdapter())
+        self._pool = None
+        # connection held by a transaction block of the current task
+        self._connection = contextvars.ContextVar('connection', default=None)
+
+    async def connect(self, url, pool_size=5, **kwargs):
+        """
+        @param url: 'username:password@host:port/db_name'
+        @param pool_size: max number of connections in the pool
+        @param kwargs: other parameters for `asyncpg.create_pool`
+        @return: self
+        """
+        import asyncpg
+        self.db.url = url
+        self._pool = await asyncpg.create_pool('postgresql://' + url, min_size=1,
+                                               max_size=pool_size, **kwargs)
+        return self
+
+    async def disconnect(self):
+        await self._pool.close()
+
+    async def _run_query(self, method, query, args):
+        """Execute a query using a method of asyncpg connection.
+        """
+        dbw.sql_logger.debug(query)
+        start_time = time.time()
+        try:
+            connection = self._connection.get()
+            if connection is not None:
+                result = await getattr(connection, method)(number_placeholders(query), *args)
+            else:
+                async with self._pool.acquire() as connection:
+                    result = await getattr(connection, method)(number_placeholders(query), *args)
+        except Exception:
+            dbw.logger.warning('The failed query: %s', query)
+            raise
+        self.db._log_query(query, start_time, time.time())
+        return result
+
+    async def execute(self, query, *args):
+        return await self._run_query('fetch', query, args)
+
+    async def commit(self):
+        """Queries are committed when executed, or when the transaction block ends.
+        """
+
+    async def rollback(self):
+        """To roll back queries raise an exception in a transaction block.
+        """
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        connection = self._connection.get()
+        if connection is not None:  # nested block - a savepoint
+            async with connection.transaction():
+                yield
+            return
+        async with self._pool.acquire() as connection:
+            async with connection.transaction():
+                token = self._connection.set(connection)
+                try:
+                    yield
+                finally:
+                    self._connection.reset(token)
+
+    async def select(self, *fields, get_query=False, **kwargs):
+        if get_query:
+            return self.db.select(*fields, get_query=True, **kwargs)
+        if kwargs.pop('stream', False) or kwargs.pop('columnar', False):
+            raise dbw.QueryError('Asyncio adapters return only plain rows.')
+        kwargs.pop('batch_size', None)
+        rows = self.db._compile_select(*fields, **kwargs)
+        records = await self._run_query('fetch', rows.query, rows.params)
+        rows.values = [rows._decode_row(record) for record in records]
+        return rows
+
+    async def insert(self, *fields):
+        query, params = self.db._compile(self.db._insert, *fields)
+        return await self._run_query('fetchval', query, params)
+
+    async def update(self, *fields, where=None, limit=None):
+        query, params = self.db._compile(self.db._update, *fields, where=where,
+                                       limit=limit)
+        status = await self._run_query('execute', query, params)
+        return int(status.rpartition(' ')[2])  # e.g. 'UPDATE 5'
+
+    async def delete(self, model, where, limit=None):
+        query, params = self.db._compile(self.db._delete, model, where, limit)
+        status = await self._run_query('execute', query, params)
+        return int(status.rpartition(' ')[2])
+
+    async def _check_table(self, query_manager):
+        """Tables are not checked, a missing table is reported by the db.
+        """
@@ -1,11 +1,88 @@
 import time
 import math
 import base64
+import threading
+import contextlib
 from datetime import date as Date, datetime as DateTime
 from decimal import Decimal
+from collections import OrderedDict
 
 import dbw
-from . import Column, Rows
+from . import Column, Rows, StreamingRows, ColumnarRows
+from .pool import ConnectionPool, _ConnectionLease
+from .stats import QueryStats
+
+
+# placeholder for a literal value in a query key
+_PARAM = object()
+
+
+def _get_condition_tables(expression, tables):
+    """Add names of the tables whose fields a condition refers to.
+    @return: False if the condition is SQL text or contains a subquery, which can read any tables
+    """
+    if isinstance(expression, str):
+        return False
+    if isinstance(expression, dbw.ModelField):
+        tables.add(str(expression.model))
+        return True
+    if not isinstance(expression, dbw.Expression):  # a value or a dict of values
+        return True
+    if expression.operation == '_MODELFIELD':
+        tables.add(str(expression.left.model))
+        return True
+    if expression.operation == '_IN' and isinstance(expression.right, str):  # subquery
+        return False
+    right = expression.right
+    operands = [expression.left] + (list(right) if isinstance(right, (list, tuple)) else [right])
+    return all(_get_condition_tables(operand, tables) for operand in operands
+               if isinstance(operand, dbw.Expression))
+
+
+def _find_field_values(expression, field):
+    """Find values of a field to which a condition restricts records, e.g. `(id = 1)`,
+    `(id IN (1, 2)) AND (...)`.
+    @return: list of values, or None if the condition does not restrict the field
+    """
+    if not isinstance(expression, dbw.Expression):
+        return None
+    operation = expression.operation
+    if operation in ('_EQ', '_IN'):
+        _field = expression.left
+        if isinstance(_field, dbw.FieldExpression):
+            _field = _field.left
+        if _field is not field:
+            return None
+        values = expression.right
+        if operation == '_EQ':
+            values = [values]
+        elif isinstance(values, str):  # subquery
+            return None
+        if any(isinstance(value, dbw.Expression) for value in values):
+            return None
+        return list(values)
+    elif operation in ('_AND', '_OR'):
+        left = _find_field_values(expression.left, field)
+        right = _find_field_values(expression.right, field)
+        if operation == '_OR':
+            return None if left is None or right is None else left + right
+        if left is None or right is None:
+            return right if left is None else left
+        return [value for value in left if value in right]
+    return None
+
+
+class _ThreadState(threading.local):
+    """Adapter state which is specific to a thread.
+    """
+    params = None  # list of (value, cast_field) when rendering in binding mode
+    transaction_depth = 0  # number of nested `transaction()` blocks
+    lease = None  # connection from the pool bound to the thread
+    # tables changed by not committed queries, None among them - unknown tables
+    written_tables = None
+    # {model: set of ids, or None - any records} of cached records changed by not committed queries
+    written_records = None
+    identity_map = None  # {(model, id): record} of the current `session()` block
 
 
 class GenericAdapter():
@@ -16,6 +93,21 @@ class GenericAdapter():
     # from this date number of days will be counted when storing DATE values in the DB
     _epoch = Date(1970, 1, 1)
     _MAX_QUERIES = 20  # how many queries to keep in log
+    _MAX_QUERY_FINGERPRINTS = 1000  # for how many query fingerprints to keep statistics
+    _MAX_COMPILED_QUERIES = 200  # how many SELECT query templates to keep for reuse
+    _MAX_QUERY_PARAMS = 999  # max number of parameters in a query
+    _NULLS_LAST = False  # whether NULLs are sorted after other values in ascending order
+    _MAX_QUERY_SIZE = 1000000  # max length of a query, together with the values
+    # whether to pass values to the driver as query parameters instead of putting them into the
+    # query text
+    bind_params = True
+    # queries executed longer than this number of seconds are logged to `dbw.slow_query` logger;
+    # None - do not log slow queries
+    slow_query_time = None
+    explain_slow_queries = False  # whether to log plans of slow queries
+    _scaled_decimals = False  # whether decimals are stored as integers scaled by 10 ** scale
+    # ResultCache instance for caching results of SELECT queries; None - do not cache them
+    result_cache = None
 
     def __str__(self):
         return "'%s://%s'" % (self.scheme, self.url)
@@ -25,17 +117,38 @@ class GenericAdapter():
         @param url: database location without scheme
         """
         self._connection = None
+        self._pool = None
+        self._local = _ThreadState()
+        self._lock = threading.Lock()  # guards data shared by threads
+        # {query_key: (query_template, cast_fields)}, in least recently used order
+        self._compiled_queries = OrderedDict()
+        self._stats = QueryStats(self._MAX_QUERIES, self._MAX_QUERY_FINGERPRINTS)
+        # [(query_start_time, query_str, query_execution_duration),]
+        self._queries = self._stats.recent
         if url:
             self.connect(url, *args, **kwargs)
 
-    def connect(self, url, autocommit=True, *args, **kwargs):
+    def connect(self, url, autocommit=True, *args, pool_size=0, max_overflow=0, pool_timeout=30,
+                idle_timeout=None, **kwargs):
         """Connect to the DB.
+        @param pool_size: if not 0, the adapter can be used by several threads: it keeps a pool of
+            connections and each thread uses its own connection from the pool
+        @param max_overflow: how many connections can be opened in addition to `pool_size`
+        @param pool_timeout: how many seconds to wait for a connection when all are in use
+        @param idle_timeout: pooled connections idle longer than this number of seconds are closed
         """
         self.url = url
         dbw.logger.debug('Creating adapter for `%s`', self)
-        self._queries = []  # [(query_start_time, query_str, query_execution_duration),]
         self.autocommit = autocommit
-        self._connection = self._connect(url, *args, **kwargs)
+        if pool_size:
+            self._pool = ConnectionPool(
+                lambda: self._connect(url, *args, **kwargs), self._close_connection,
+                self._ping, size=pool_size, max_overflow=max_overflow, timeout=pool_timeout,
+                idle_timeout=idle_timeout)
+            # open the first connection right away to check the connection parameters
+            self._pool.put(self._pool.get())
+        else:
+            self._connection = self._connect(url, *args, **kwargs)
 
     def _connect(self, url, *args, **kwargs):
         """Connect to the DB. To be overridden in subclasses.
@@ -43,41 +156,307 @@ class GenericAdapter():
         """
         raise NotImplementedError()
 
+    def _close_connection(self, connection):
+        """Close a database connection.
+        """
+        connection.close()
+
+    def _ping(self, connection):
+        """Check if a pooled connection is still usable.
+        """
+        try:
+            connection.cursor().execute('SELECT 1')
+            connection.rollback()
+        except Exception:
+            return False
+        return True
+
     def disconnect(self):
+        if self._pool is not None:
+            self.release_connection()
+            self._pool.close()
+            self._pool = None
         if self._connection:
-            self._connection.close()
+            self._close_connection(self._connection)
             self._connection = None
 
-    def execute(self, query, *args):
+    def _get_connection(self):
+        """Get the connection to be used by the current thread. With a connection pool, the
+        thread is given a connection from the pool, which stays bound to it until the end of
+        `connection()` block, `release_connection()` call or the end of the thread.
+        """
+        if self._pool is None:
+            if not self._connection:
+                raise dbw.AdapterError('No connection has been set yet.')
+            return self._connection
+        lease = self._local.lease
+        if lease is None:
+            lease = self._local.lease = _ConnectionLease(self._pool)
+        return lease.connection
+
+    def release_connection(self):
+        """Return the connection bound to the current thread to the pool. What was not committed
+        is rolled back.
+        """
+        lease = self._local.lease
+        if lease is not None:
+            if self._local.transaction_depth:
+                raise dbw.AdapterError('Cannot release the connection inside a transaction.')
+            self._local.lease = None
+            lease.release()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Context manager which binds a connection from the pool to the current thread for the
+        duration of the block, e.g. for handling a web request.
+        """
+        if self._pool is None or self._local.lease is not None:
+            yield
+            return
+        self._get_connection()
+        try:
+            yield
+        finally:
+            self.release_connection()
+
+    def execute(self, query, *args, cursor=None):
         """Execute a query.
+        @param cursor: cursor to execute the query with, by default a new one
         @return: cursor object
         """
         dbw.sql_logger.debug(query)
-        if not self._connection:
-            raise dbw.AdapterError('No connection has been set yet.')
-        cursor = self._connection.cursor()  # create a new cursor
+        if cursor is None:
+            cursor = self._get_connection().cursor()  # create a new cursor
         start_time = time.time()
         try:
-            cursor.execute(query, args)
+            self._execute(cursor, query, args)
             if self.autocommit:
                 self.commit()
         except Exception:
             dbw.logger.warning('The failed query: %s', query)
             raise
         finish_time = time.time()
-        self._queries.append((start_time, query, finish_time - start_time))
-        self._queries = self._queries[-self._MAX_QUERIES:]
+        if self.result_cache is not None:
+            self._invalidate_results(query)
+        self._log_query(query, start_time, finish_time,
+                        cursor.rowcount if cursor.rowcount >= 0 else None)
+        if self.slow_query_time is not None and finish_time - start_time >= self.slow_query_time:
+            self._log_slow_query(query, args, finish_time - start_time)
         return cursor
 
+    def _execute_stream(self, query, params, batch_size):
+        """Execute a query whose results are going to be fetched in batches.
+        @return: cursor object
+        """
+        return self.execute(query, *params)
+
+    def _close_stream(self, cursor):
+        """Close the cursor of a streamed query after its rows were fetched.
+        """
+        cursor.close()
+
+    def _invalidate_results(self, query):
+        """Drop cached results read from the tables a query changes. Tables changed by not
+        committed queries are remembered to drop the results again at commit, as other threads
+        can cache the old data meanwhile.
+        """
+        tables = self.result_cache.get_written_tables(query)
+        if tables == []:
+            return
+        self.result_cache.invalidate(tables)
+        local = self._local
+        if local.transaction_depth or not self.autocommit:
+            if local.written_tables is None:
+                local.written_tables = set()
+            local.written_tables.update(tables or [None])
+
+    def _invalidate_committed_results(self):
+        """Drop again cached results and records changed by the committed queries.
+        """
+        local = self._local
+        written_tables = local.written_tables
+        if written_tables is not None:
+            local.written_tables = None
+            if self.result_cache is not None:
+                self.result_cache.invalidate(None if None in written_tables else written_tables)
+        written_records = local.written_records
+        if written_records is not None:
+            local.written_records = None
+            for model, ids in written_records.items():
+                model._meta.record_cache.invalidate(self, ids)
+
+    def _log_query(self, query, start_time, finish_time, rows_count=None):
+        """Remember an executed query and account it in the statistics.
+        @param rows_count: number of rows returned or affected by the query, if known
+        """
+        self._stats.add(query, start_time, finish_time - start_time, rows_count)
+
+    def _log_slow_query(self, query, args, duration):
+        """Log a query which was executed longer than `slow_query_time`. The query details are
+        also attached to the log record as `query`, `params`, `duration` and `plan` attributes.
+        """
+        plan = self._explain_query(query, args) if self.explain_slow_queries else None
+        dbw.slow_query_logger.warning(
+            'Slow query (%.3f s): %s\nParameters: %r%s', duration, query, args,
+            '' if plan is None else '\nPlan: %s' % (plan,),
+            extra={'query': query, 'params': args, 'duration': duration, 'plan': plan})
+
+    def _explain_query(self, query, args):
+        """Get the plan of a query from the db.
+        @return: the plan in db specific form or None if it is not available
+        """
+        if query.lstrip()[:6].upper() not in ('SELECT', 'INSERT', 'UPDATE', 'DELETE'):
+            return None
+        try:
+            return self._get_query_plan(query, args)
+        except Exception as exc:
+            dbw.logger.debug('Could not get the plan of the query: %s\n%s', query, exc)
+            return None
+
+    def _get_query_plan(self, query, args):
+        """Query the db for the plan of a query. To be overridden in subclasses.
+        """
+        return None
+
+    def _parse_query_plan(self, query, plan):
+        """Parse the plan returned by `_get_query_plan`. To be overridden in subclasses.
+        @return: QueryPlan instance
+        """
+        raise NotImplementedError()
+
+    def stats(self, reset=False):
+        """Get statistics of the executed queries. Queries which differ only in values are
+        grouped under the same fingerprint.
+        @param reset: clear the statistics after getting them
+        @return: dict with keys `queries` - list of dicts with statistics for each fingerprint
+            (calls, total/min/max/mean time, rows, duration histogram), the most time consuming
+            first; `recent` - list of recently executed queries (start_time, query, duration)
+        """
+        stats = {'queries': self._stats.get(), 'recent': list(self._stats.recent)}
+        if reset:
+            self._stats.reset()
+        return stats
+
+    def _execute(self, cursor, query, args):
+        """Pass a query to the driver. To be overridden in subclasses.
+        """
+        cursor.execute(query, args)
+
     def commit(self):
-        if not self._connection:
-            raise dbw.AdapterError('No connection has been set yet.')
-        self._connection.commit()
+        """Commit the current transaction. Inside a `transaction()` block does nothing - the
+        transaction is committed at the end of the block.
+        """
+        if self._local.transaction_depth:
+            return
+        self._get_connection().commit()
+        self._invalidate_committed_results()
 
     def rollback(self):
-        if not self._connection:
-            raise dbw.AdapterError('No connection has been set yet.')
-        return self._connection.rollback()
+        if self._local.transaction_depth:
+            raise dbw.AdapterError('Cannot roll back inside a transaction block - raise an '
+                                   'exception to leave the block instead.')
+        self._local.written_tables = self._local.written_records = None
+        return self._get_connection().rollback()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Context manager for executing several queries in one transaction. Queries are not
+        committed one by one, the transaction is committed once when the block ends, or rolled back
+        if an exception is raised in it. Nested blocks are executed in savepoints, so an exception
+        in a nested block rolls back only the queries executed in it.
+        With a connection pool the transaction holds the connection of the thread.
+        """
+        local = self._local
+        depth = local.transaction_depth
+        if depth:
+            savepoint = 'dbw_savepoint_%i' % depth
+            self.execute('SAVEPOINT %s' % savepoint)
+            local.transaction_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.execute('ROLLBACK TO SAVEPOINT %s' % savepoint)
+                self.execute('RELEASE SAVEPOINT %s' % savepoint)
+                raise
+            else:
+                self.execute('RELEASE SAVEPOINT %s' % savepoint)
+            finally:
+                local.transaction_depth = depth
+        else:
+            with self.connection():
+                connection = self._get_connection()
+                # set before BEGIN, so that queries are not autocommitted from the start
+                local.transaction_depth = 1
+                try:
+                    self._begin()
+                    yield self
+                except BaseException:
+                    local.written_tables = local.written_records = None
+                    connection.rollback()
+                    raise
+                else:
+                    connection.commit()
+                    self._invalidate_committed_results()
+                finally:
+                    local.transaction_depth = 0
+
+    @contextlib.contextmanager
+    def session(self):
+        """Context manager for a unit of work, e.g. handling of a request. Records loaded or
+        saved by the current thread through the adapter inside the block are kept in an identity
+        map: loading a record again gives the same instance, and getting a record by id, also
+        when accessing a related record, does not query the db. Changes of the records made by
+        other queries are not seen by the already loaded instances. Nested blocks share the
+        records of the outer block.
+        """
+        local = self._local
+        if local.identity_map is not None:
+            yield self
+            return
+        local.identity_map = {}
+        try:
+            yield self
+        finally:
+            local.identity_map = None
+
+    def _get_identity_map(self):
+        """@return: {(model, id): record} of the current `session()` block, or None
+        """
+        return self._local.identity_map
+
+    def _get_record_cache(self, model):
+        """@return: RecordCache of the model, or None if its records are not cached
+        """
+        return model._meta.record_cache
+
+    def _invalidate_records(self, model, where=None, ids=None):
+        """Drop cached records of a model which an executed query could change. Records changed by
+        not committed queries are remembered to drop them again at commit, as other threads can
+        cache the old data meanwhile.
+        @param where: condition of the query
+        @param ids: ids of the changed records, instead of the condition; if neither is given,
+            any record can be changed
+        """
+        record_cache = model._meta.record_cache
+        if record_cache is None:
+            return
+        if ids is None and where is not None:
+            ids = _find_field_values(where, model._meta.fields['id'])
+        record_cache.invalidate(self, ids)
+        local = self._local
+        if local.transaction_depth or not self.autocommit:
+            if local.written_records is None:
+                local.written_records = {}
+            written_ids = local.written_records.get(model, set())
+            if ids is None or written_ids is None:
+                local.written_records[model] = None
+            else:
+                local.written_records[model] = written_ids | set(ids)
+
+    def _begin(self):
+        """Start a transaction, if the driver doesn't start it implicitly on the next query.
+        To be overridden in subclasses.
+        """
 
     def get_last_query(self):
         return self._queries[-1] if self._queries else (0, '', 0)
@@ -123,7 +502,7 @@ class GenericAdapter():
 
     def _LIKE(self, expression, pattern):
         "The LIKE Operator."
-        return "(%s LIKE '%s')" % (self.render(expression), pattern)
+        return '(%s LIKE %s)' % (self.render(expression), self.render(pattern))
 
     def _CONCAT(self, expressions):  # ((expression1) || (expression2) || ...)
         "Concatenate two or more expressions."
@@ -187,6 +566,8 @@ class GenericAdapter():
     def render(self, value, cast_field=None):
         """Render of a value (Expression, Field or simple (scalar?) value) in a format suitable for
         operations with cast_field in the DB.
+        In parameter binding mode values are not put into the query - a placeholder is rendered
+        instead and the value is remembered to be passed to the driver.
         @param value:
         @param cast_field:
         """
@@ -202,6 +583,13 @@ class GenericAdapter():
 #                assert isinstance(cast_field, dbw.Expression), 'Cast field must be an Expression.'
 #                if cast_field.__class__ is dbw.Expression:  # Field - subclass of Expression
 #                    cast_field = cast_field.type  # expression right operand type
+            else:
+                cast_field = None
+            params = self._local.params
+            if value is not None and params is not None:
+                params.append((value, cast_field))
+                return '%s'
+            if cast_field is not None:
                 value = cast_field._cast(value)
                 try:
                     return self._render(value, cast_field.column)
@@ -216,22 +604,135 @@ class GenericAdapter():
         of DB.
         If there is no column - present the value as string.
         Values are always passed to queries as quoted strings. I.e. even integers like 123 are put
-        like '123'.
+        like '123'. Only numbers returned by column encoders are put as is.
         """
         if value is None:
             return self._NULL()
         if column:
             assert isinstance(column, Column), 'It must be a Column instance.'
-            encode_func_name = '_encode_' + column.type.upper()
-            encode_func = getattr(self, encode_func_name, None)
+            encode_func = getattr(self, '_encode_' + column.type.upper(), None)
             if encode_func:
                 value = encode_func(value, column)
-                assert isinstance(value, (str, int, Decimal)), \
-                    'Encode `%s.%s` function did not return a string, integer or decimal' \
-                    % (dbw.get_object_path(self), '_encode_' + column.type.upper())
-                return str(value)
+                if isinstance(value, (int, Decimal)):
+                    return str(value)
         return self.escape(value)
 
+    def _encode(self, value, cast_field=None):
+        """Convert a value to the form in which it is passed to the driver as a query parameter.
+        @param value: the value
+        @param cast_field: ModelField whose column encoder is applied to the value
+        """
+        if cast_field is None:
+            return value
+        value = cast_field._cast(value)
+        if value is None:
+            return None
+        column = cast_field.column
+        encode_func = getattr(self, '_encode_' + column.type.upper(), None)
+        if encode_func:
+            value = encode_func(value, column)
+        return value
+
+    def _compile(self, render_func, *args, **kwargs):
+        """Call a query rendering function (`_select`, `_insert`, ...) in parameter binding mode.
+        @return: tuple (query with `%s` placeholders, list of parameters for the placeholders)
+        """
+        if not self.bind_params:
+            return render_func(*args, **kwargs), []
+        query, params = self._render_template(render_func, *args, **kwargs)
+        return query, [self._encode(value, cast_field) for value, cast_field in params]
+
+    def _render_template(self, render_func, *args, **kwargs):
+        """Call a query rendering function in parameter binding mode.
+        @return: tuple (query with `%s` placeholders, list of tuples (value, cast_field))
+        """
+        local = self._local
+        params = local.params = []
+        try:
+            query = render_func(*args, **kwargs)
+        finally:
+            local.params = None
+        return query, params
+
+    def _get_expression_key(self, value, values):
+        """Get a hashable key representing the structure of an Expression tree. Literal values
+        found in the tree are replaced by a placeholder and are appended to `values`.
+        """
+        if isinstance(value, dbw.Expression):
+            return (value.__class__,) + tuple(
+                (name, self._get_expression_key(attr, values) if name in ('left', 'right')
+                 else attr)
+                for name, attr in sorted(value.__dict__.items()))
+        elif isinstance(value, (list, tuple)):
+            return tuple(self._get_expression_key(item, values) for item in value)
+        elif (value is None or value is dbw.Nil or isinstance(value, dbw.ModelField)
+              or dbw.is_model(value)):
+            return value
+        values.append(value)
+        return _PARAM
+
+    def _get_query_key(self, value, values):
+        """Get a hashable key representing the structure of a SELECT query argument.
+        """
+        if isinstance(value, dbw.Expression):
+            return self._get_expression_key(value, values)
+        elif isinstance(value, dbw.Join):
+            return (value.__class__, value.model, self._get_expression_key(value.on, values),
+                    value.type)
+        elif isinstance(value, (list, tuple)):
+            return tuple(self._get_query_key(item, values) for item in value)
+        elif isinstance(value, dict):
+            return tuple((key, self._get_expression_key(item, values))
+                         for key, item in value.items())
+        return value
+
+    def _compile_select(self, *fields, from_='', where='', orderby='', limit=None,
+                        distinct='', groupby='', having=''):
+        """Create SELECT query in parameter binding mode. The query template rendered for a query
+        of the same structure (which differs only in values) is reused.
+        @return: Rows instance with the query and its parameters
+        """
+        if not self.bind_params:
+            return self._select(*fields, from_=from_, where=where, orderby=orderby, limit=limit,
+                                distinct=distinct, groupby=groupby, having=having)
+        # the key parts are in the same order in which the query is rendered
+        values = []
+        key = (self._get_query_key(fields, values),)
+        # names of the fields with values differ from those of the fields the rows are reused for
+        fields_have_values = bool(values)
+        key += tuple(self._get_query_key(arg, values) for arg in (
+            from_, where, groupby, having, orderby, limit, distinct))
+        compiled_queries = self._compiled_queries
+        try:
+            with self._lock:
+                compiled_query = compiled_queries.get(key)
+                if compiled_query is not None:
+                    compiled_queries.move_to_end(key)
+        except TypeError:  # something unhashable in the query
+            key = compiled_query = None
+
+        if compiled_query is None:
+            rows, params = self._render_template(
+                self._select, *fields, from_=from_, where=where, orderby=orderby, limit=limit,
+                distinct=distinct, groupby=groupby, having=having)
+            # reuse the template only if the values were rendered in the order they are found
+            if key is not None and len(params) == len(values) and all(
+                    value is _value for (value, _), _value in zip(params, values)):
+                with self._lock:
+                    compiled_queries[key] = (rows.query, tuple(field for _, field in params),
+                                             None if fields_have_values else rows._layout)
+                    if len(compiled_queries) > self._MAX_COMPILED_QUERIES:
+                        compiled_queries.popitem(last=False)
+            values = [value for value, _ in params]
+            cast_fields = [cast_field for _, cast_field in params]
+        else:
+            query, cast_fields, layout = compiled_query
+            rows = Rows(self, query, fields, layout=layout)
+
+        rows.params = [self._encode(value, cast_field)
+                       for value, cast_field in zip(values, cast_fields)]
+        return rows
+
     def escape(self, value):
         """Convert a value to string, escape single quotes and enclose it in single quotes.
         """
@@ -326,7 +827,7 @@ class GenericAdapter():
 
     def _encode_INT(self, value, column):
         """Encode a value for insertion in a column of INT type."""
-        return str(int(value))
+        return int(value)
 
     def _declare_BOOL(self, column):
         """Render declaration of BOOLEAN column type. Store boolean as 0/1 integer.
@@ -343,7 +844,7 @@ class GenericAdapter():
 
     def _encode_BOOL(self, value, column):
         """Encode a value for insertion in a column of INT type."""
-        return str(int(value))
+        return int(value)
 
     def _decode_BOOL(self, value, column):
         """Decode a value from the DB to a value good for the corresponding model field."""
@@ -444,7 +945,7 @@ class GenericAdapter():
         return column_str
 
     def _encode_BLOB(self, value, column):
-        return "'%s'" % base64.b64encode(value)
+        return base64.b64encode(value).decode()
 
     def _decode_BLOB(self, value, column):
         return base64.b64decode(value)
@@ -496,12 +997,251 @@ class GenericAdapter():
         @param get_query: don't execute the query - only return the generated SQL
         @return: id of the inserted record
         """
-        query = self._insert(*fields)
         if get_query:
-            return query
-        cursor = self.execute(query)
+            return self._insert(*fields)
+        query, params = self._compile(self._insert, *fields)
+        cursor = self.execute(query, *params)
         return self._get_last_insert_id(cursor)
 
+    def _insert_many(self, fields, rows, upsert=None):
+        """Create multi-row INSERT query.
+        INSERT INTO table_name ( col_name1, col_name2, ... )
+          VALUES ( expression1_1, expression1_2, ... ), ( expression2_1, expression2_2, ... ), ...
+          [ ON CONFLICT ... ]
+        @param fields: list of ModelFields of the same model
+        @param rows: list of sequences of values for the fields
+        @param upsert: tuple (conflict_fields, update) for upserts - see `_ON_CONFLICT`
+        """
+        keys = ', '.join(field.column.name for field in fields)
+        values = ', '.join(
+            '(%s)' % ', '.join(self.render(value, field) for field, value in zip(fields, row))
+            for row in rows)
+        query = 'INSERT INTO %s (%s) VALUES %s' % (fields[0].model, keys, values)
+        if upsert is not None:
+            query += ' ' + self._ON_CONFLICT(*upsert)
+        return query
+
+    def _ON_CONFLICT(self, conflict_fields, update):
+        """Render what to do when an inserted row violates a unique index.
+        ON CONFLICT ( col_name1, ... ) DO UPDATE SET col_name2 = excluded.col_name2, ...
+        @param conflict_fields: list of ModelFields of the unique index
+        @param update: list of ModelFields to set to the inserted values, or tuples
+            (ModelField, value) to set to the given value
+        """
+        conflict = ', '.join(field.column.name for field in conflict_fields)
+        if not update:
+            return 'ON CONFLICT (%s) DO NOTHING' % conflict
+        sql_v = ', '.join(
+            '%s = %s' % (item[0].column.name, self.render(item[1], item[0]))
+            if isinstance(item, tuple) else '%s = excluded.%s' % (item.column.name,
+                                                                  item.column.name)
+            for item in update)
+        return 'ON CONFLICT (%s) DO UPDATE SET %s' % (conflict, sql_v)
+
+    def _get_last_insert_ids(self, cursor, rows_count):
+        """Get IDs of the records inserted by a multi-row INSERT.
+        @return: list of ids or None if the db cannot tell them
+        """
+        return None
+
+    def _get_insert_fields(self, fields):
+        """Check fields given for a multi-row insert.
+        @param fields: a model or list of fields of one model
+        @return: tuple (list of ModelFields, indexes of those which are not autoincrement)
+        """
+        model_fields = []
+        for field in fields:
+            if isinstance(field, dbw.FieldExpression):
+                field = field.left
+            if not isinstance(field, dbw.ModelField):
+                raise dbw.QueryError('Pass a model or a list of fields.')
+            if model_fields and field.model is not model_fields[0].model:
+                raise dbw.QueryError('Pass fields of the same table')
+            model_fields.append(field)
+        # autoincrement fields are filled by the db
+        indexes = [i for i, field in enumerate(model_fields) if not field.column.autoincrement]
+        if not indexes:
+            raise dbw.QueryError('Pass at least one field which is not autoincrement.')
+        return model_fields, indexes
+
+    def insert_many(self, fields, rows, batch_size=None, get_ids=True):
+        """Insert many records in the db using multi-row INSERT queries. Rows are inserted in
+        chunks, so that the queries do not exceed number of parameters and size limits of the db.
+        @param fields: a model, whose all fields are given in rows, or list of fields of one model
+        @param rows: iterable (can be a generator) of sequences of values for the fields
+        @param batch_size: max number of rows in one query
+        @param get_ids: whether to collect ids of the inserted records
+        @return: list of ids of the inserted records, or None if they were not requested or the db
+            cannot tell them
+        """
+        model_fields, indexes = self._get_insert_fields(fields)
+        fields = [model_fields[i] for i in indexes]
+
+        max_rows = max(1, self._MAX_QUERY_PARAMS // len(fields))
+        if batch_size:
+            max_rows = min(max_rows, batch_size)
+        ids = [] if get_ids else None
+
+        def insert_chunk(chunk):
+            nonlocal ids
+            query, params = self._compile(self._insert_many, fields, chunk)
+            cursor = self.execute(query, *params)
+            if ids is not None:
+                chunk_ids = self._get_last_insert_ids(cursor, len(chunk))
+                if chunk_ids is None:
+                    ids = None
+                else:
+                    ids.extend(chunk_ids)
+
+        def get_rows():
+            for row in rows:
+                if len(row) != len(model_fields):
+                    raise dbw.QueryError('Expected %i values in a row, got %i.'
+                                         % (len(model_fields), len(row)))
+                yield [row[i] for i in indexes]
+
+        for chunk in self._get_chunks(get_rows(), max_rows):
+            insert_chunk(chunk)
+        return ids
+
+    def _get_upsert_args(self, fields, conflict, update):
+        """Check arguments of an upsert.
+        @param fields: list of inserted ModelFields
+        @return: tuple (conflict_fields, update) for `_insert_many`
+        """
+        model = fields[0].model
+        unique_indexes = [db_index for db_index in model._meta.db_indexes
+                          if db_index.type == 'unique']
+        if conflict is None:
+            if len(unique_indexes) != 1:
+                raise dbw.QueryError('Model `%r` has %i unique indexes, pass the one to detect '
+                                     'conflicts on.' % (model, len(unique_indexes)))
+            conflict = unique_indexes[0]
+        elif not isinstance(conflict, dbw.DbIndex):
+            # field(s) of a unique index
+            # fields are compared by identity, as their `==` builds an expression
+            conflict_fields = {id(field.left if isinstance(field, dbw.FieldExpression) else field)
+                               for field in dbw.listify(conflict)}
+            for db_index in unique_indexes:
+                if {id(index_field.field) for index_field in db_index.index_fields} \
+                        == conflict_fields:
+                    conflict = db_index
+                    break
+            else:
+                raise dbw.QueryError('There is no unique index on the given conflict fields.')
+        elif not any(conflict is db_index for db_index in unique_indexes):
+            raise dbw.QueryError('Pass a unique index of model `%r`.' % model)
+        conflict_fields = [index_field.field for index_field in conflict.index_fields]
+
+        if update is None:
+            update = [field for field in fields
+                      if not any(field is conflict_field for conflict_field in conflict_fields)]
+        _update = []
+        for item in update:
+            field = item[0] if isinstance(item, (list, tuple)) else item
+            if isinstance(field, dbw.FieldExpression):
+                field = field.left
+            if not isinstance(field, dbw.ModelField) or field.model is not model:
+                raise dbw.QueryError('Pass fields of model `%r` to update.' % model)
+            _update.append((field, item[1]) if isinstance(item, (list, tuple)) else field)
+        return conflict_fields, _update
+
+    def _get_upsert_ids(self, cursor, rows_count):
+        """Get IDs of the records inserted or updated by an upsert.
+        @return: list of ids or None if the db cannot tell them
+        """
+        return None
+
+    def upsert(self, *fields, conflict=None, update=None, get_query=False):
+        """Insert a record, or update the existing one if the record violates a unique index.
+        @param *fields: tuples in form (Field, value)
+        @param conflict: unique index (DbUnique) of the model, or field(s) of one, to detect the
+            existing record; can be omitted if the model has one unique index
+        @param update: list of fields to update in the existing record with the given values, or
+            tuples (Field, value) to update with another value; by default all given fields which
+            are not in the unique index; if empty, the existing record is left intact
+        @param get_query: don't execute the query - only return the generated SQL
+        @return: id of the inserted or updated record, or None if the db cannot tell it
+        """
+        _fields = []
+        values = []
+        for item in fields:
+            if not isinstance(item, (list, tuple)) or len(item) != 2:
+                raise dbw.QueryError('Pass tuples with 2 items: (field, value).')
+            _fields.append(item[0])
+            values.append(item[1])
+        model_fields, indexes = self._get_insert_fields(_fields)
+        fields = [model_fields[i] for i in indexes]
+        values = [values[i] for i in indexes]
+        upsert = self._get_upsert_args(fields, conflict, update)
+        if get_query:
+            return self._insert_many(fields, [values], upsert)
+        query, params = self._compile(self._insert_many, fields, [values], upsert)
+        cursor = self.execute(query, *params)
+        self._invalidate_records(fields[0].model)
+        ids = self._get_upsert_ids(cursor, 1)
+        return ids[0] if ids else None
+
+    def upsert_many(self, fields, rows, conflict=None, update=None, batch_size=None):
+        """Insert or update many records using multi-row upserts, in chunks like `insert_many`.
+        A chunk must not contain several rows with the same values of the unique index.
+        @param fields: a model, whose all fields are given in rows, or list of fields of one model
+        @param rows: iterable (can be a generator) of sequences of values for the fields
+        @param conflict: see `upsert`
+        @param update: see `upsert`
+        @param batch_size: max number of rows in one query
+        @return: list of ids of the inserted or updated records, or None if the db cannot tell
+            them
+        """
+        model_fields, indexes = self._get_insert_fields(fields)
+        fields = [model_fields[i] for i in indexes]
+        upsert = self._get_upsert_args(fields, conflict, update)
+
+        max_rows = max(1, self._MAX_QUERY_PARAMS // (len(fields) + len(upsert[1])))
+        if batch_size:
+            max_rows = min(max_rows, batch_size)
+
+        def get_rows():
+            for row in rows:
+                if len(row) != len(model_fields):
+                    raise dbw.QueryError('Expected %i values in a row, got %i.'
+                                         % (len(model_fields), len(row)))
+                yield [row[i] for i in indexes]
+
+        ids = []
+        for chunk in self._get_chunks(get_rows(), max_rows):
+            query, params = self._compile(self._insert_many, fields, chunk, upsert)
+            cursor = self.execute(query, *params)
+            self._invalidate_records(fields[0].model)
+            chunk_ids = self._get_upsert_ids(cursor, len(chunk))
+            if chunk_ids is None:
+                ids = None
+            elif ids is not None:
+                ids.extend(chunk_ids)
+        return ids
+
+    def _get_chunks(self, rows, max_rows):
+        """Split rows of values into chunks, so that a query with a chunk does not exceed number
+        of parameters and size limits of the db.
+        @param rows: iterable of sequences of values
+        @param max_rows: max number of rows in a chunk
+        """
+        chunk = []
+        chunk_size = 0
+        for row in rows:
+            # approximate length of the row in the query
+            row_size = sum(len(value) if isinstance(value, (str, bytes)) else 20
+                           for value in row)
+            if chunk and (len(chunk) >= max_rows
+                          or chunk_size + row_size > self._MAX_QUERY_SIZE):
+                yield chunk
+                chunk = []
+                chunk_size = 0
+            chunk.append(row)
+            chunk_size += row_size
+        if chunk:
+            yield chunk
+
     def _update(self, *fields, where=None, limit=None):
         """UPDATE table_name SET col_name1 = expression1, col_name2 = expression2, ...
            [ WHERE expression ] [ LIMIT limit_amount ]
@@ -516,9 +1256,10 @@ class GenericAdapter():
             if model is None:
                 model = _model
             assert model is _model, 'Pass fields from the same model'
-        sql_w = (' WHERE ' + self.render(where)) if where else ''
+        # values are rendered before `where`, so query parameters are in the right order
         sql_v = ', '.join(['%s= %s' % (field.column.name, self.render(value, field))
                            for (field, value) in fields])
+        sql_w = (' WHERE ' + self.render(where)) if where else ''
         sql_other = self._LIMIT(limit)
 
         return 'UPDATE %s SET %s%s%s' % (model, sql_v, sql_w, sql_other)
@@ -531,12 +1272,71 @@ class GenericAdapter():
         @param get_query: don't execute the query - only return the generated SQL
         @return: number of affected rows
         """
-        query = self._update(*fields, where=where)
         if get_query:
-            return query
-        cursor = self.execute(query)
+            return self._update(*fields, where=where)
+        query, params = self._compile(self._update, *fields, where=where)
+        cursor = self.execute(query, *params)
+        self._invalidate_records(fields[0][0].model, where)
         return cursor.rowcount
 
+    def _update_many(self, key, fields, rows):
+        """Create UPDATE query which sets different values in each row.
+        UPDATE table_name SET col_name1 = CASE key_name WHEN key1 THEN expression1_1 ... END, ...
+          WHERE key_name IN (key1, key2, ...)
+        @param key: ModelField identifying the rows to update
+        @param fields: list of ModelFields to update
+        @param rows: list of sequences of values: key value followed by values for the fields
+        """
+        sql_v = ', '.join(
+            '%s = CASE %s %s END' % (field.column.name, key.column.name, ' '.join(
+                'WHEN %s THEN %s' % (self.render(row[0], key), self.render(row[i], field))
+                for row in rows))
+            for i, field in enumerate(fields, 1))
+        sql_w = ', '.join(self.render(row[0], key) for row in rows)
+        return 'UPDATE %s SET %s WHERE %s IN (%s)' % (key.model, sql_v, key.column.name, sql_w)
+
+    def update_many(self, model, fields, rows, key=None, batch_size=None):
+        """Update many records setting different values in each of them. Rows are updated in
+        chunks, with one query per chunk.
+        @param model: model whose records to update
+        @param fields: list of fields of the model to update
+        @param rows: iterable (can be a generator) of sequences of values: value of the key field
+            identifying the record, followed by values for the fields
+        @param key: field identifying the records, by default `model.id`
+        @param batch_size: max number of rows in one query
+        @return: number of updated rows
+        """
+        fields = [model.id if key is None else key] + list(fields)
+        for i, field in enumerate(fields):
+            if isinstance(field, dbw.FieldExpression):
+                field = fields[i] = field.left
+            if not isinstance(field, dbw.ModelField) or field.model is not model:
+                raise dbw.QueryError('Pass fields of model `%r`.' % model)
+        key, fields = fields[0], fields[1:]
+        if not fields:
+            raise dbw.QueryError('Pass at least one field to update.')
+
+        # each value is a parameter, key values are repeated for each field
+        max_rows = max(1, self._MAX_QUERY_PARAMS // (2 * len(fields) + 1))
+        if batch_size:
+            max_rows = min(max_rows, batch_size)
+
+        def get_rows():
+            for row in rows:
+                if len(row) != len(fields) + 1:
+                    raise dbw.QueryError('Expected %i values in a row, got %i.'
+                                         % (len(fields) + 1, len(row)))
+                yield row
+
+        rows_count = 0
+        for chunk in self._get_chunks(get_rows(), max_rows):
+            query, params = self._compile(self._update_many, key, fields, chunk)
+            cursor = self.execute(query, *params)
+            rows_count += cursor.rowcount
+            ids = [row[0] for row in chunk] if key is model._meta.fields['id'] else None
+            self._invalidate_records(model, ids=ids)
+        return rows_count
+
     def _delete(self, model, where, limit=None):
         """DELETE FROM table_name [ WHERE expression ] [ LIMIT limit_amount ]"""
         assert dbw.is_model(model)
@@ -551,10 +1351,11 @@ class GenericAdapter():
         @param get_query: don't execute the query - only return the generated SQL
         @return: number of affected rows
         """
-        query = self._delete(model, where)
         if get_query:
-            return query
-        cursor = self.execute(query)
+            return self._delete(model, where)
+        query, params = self._compile(self._delete, model, where)
+        cursor = self.execute(query, *params)
+        self._invalidate_records(model, where)
         return cursor.rowcount
 
     def _select(self, *fields, from_='', where='', orderby='', limit=None,
@@ -684,8 +1485,22 @@ class GenericAdapter():
 
         return Rows(self, sql, fields)
 
+    def explain(self, *fields, from_='', where='', orderby='', limit=None,
+                distinct='', groupby='', having=''):
+        """Get the plan of a SELECT query, which the db would use to execute it. The arguments are
+        the same as for `select`.
+        @return: QueryPlan instance
+        """
+        rows = self._compile_select(*fields, from_=from_, where=where, orderby=orderby,
+                                    limit=limit, distinct=distinct, groupby=groupby, having=having)
+        plan = self._get_query_plan(rows.query, rows.params)
+        if plan is None:
+            raise dbw.AdapterError('%s adapter cannot explain queries.' % self.scheme)
+        return self._parse_query_plan(rows.query, plan)
+
     def select(self, *fields, from_='', where='', orderby='', limit=None,
-               distinct='', groupby='', having='', get_query=False):
+               distinct='', groupby='', having='', get_query=False, stream=False,
+               batch_size=1000, columnar=False, cache=True):
         """Create and return SELECT query.
         @param fields: tables, fields or joins;
         @param from_: tables and joined tables to select from.
@@ -698,13 +1513,73 @@ class GenericAdapter():
         @param groupby: list of expressions to group by
         @param having: list of condition expressions to apply within group by
         @param get_query: don't execute the query - only return the generated SQL
-        @return: Rows instance containing the SELECT result
+        @param stream: fetch and decode the rows in batches while they are iterated, instead of
+            fetching all of them at once; with PostgreSql stream big results inside a
+            `transaction()` block, see `PostgreSqlAdapter._execute_stream`
+        @param batch_size: number of rows fetched at once when streaming
+        @param columnar: return the values by columns (ColumnarRows); 'scaled' - also keep
+            decimals, which the db stores as scaled integers, as such integers
+        @param cache: whether to use `result_cache` of the adapter, if it is set; a number - also
+            how many seconds to keep the result instead of the cache `ttl`
+        @return: Rows (StreamingRows, ColumnarRows) instance containing the SELECT result
         tables are taken from fields and `where` expression;
         """
-        rows = self._select(*fields, from_=from_, where=where, orderby=orderby,
-                            limit=limit, distinct=distinct, groupby=groupby, having=having)
-        assert isinstance(rows, Rows)
         if get_query:
-            return rows.query
+            return self._select(*fields, from_=from_, where=where, orderby=orderby, limit=limit,
+                                distinct=distinct, groupby=groupby, having=having).query
+        rows = self._compile_select(*fields, from_=from_, where=where, orderby=orderby,
+                                    limit=limit, distinct=distinct, groupby=groupby, having=having)
+        assert isinstance(rows, Rows)
+        if stream and columnar:
+            raise dbw.QueryError('Columnar results cannot be streamed.')
+        if stream:
+            rows = StreamingRows(self, rows.query, rows.fields, rows.params, batch_size,
+                                 layout=rows._layout)
+        elif columnar:
+            rows = ColumnarRows(self, rows.query, rows.fields, rows.params,
+                                scaled_decimals=(columnar == 'scaled'), layout=rows._layout)
+        elif cache and self.result_cache is not None:
+            self._execute_cached(rows, self._get_select_tables(fields, from_, where, having),
+                                 None if cache is True else cache)
+            return rows
         rows.execute_query()
         return rows
+
+    def _get_select_tables(self, fields, from_, where=None, having=None):
+        """Get names of the tables a SELECT query reads.
+        @return: set of table names, or None if they are not known, e.g. when the query has SQL
+            text in `from_` or a subquery in the conditions
+        """
+        tables = set()
+        for arg in dbw.listify(from_) if from_ else fields:
+            if from_ and isinstance(arg, str):
+                return None
+            model = getattr(arg, 'model', arg)  # a Join or a field
+            if dbw.is_model(model):
+                tables.add(str(model))
+        for condition in (where, having):
+            if condition and not _get_condition_tables(condition, tables):
+                return None
+        return tables or None
+
+    def _execute_cached(self, rows, tables, ttl):
+        """Execute the query of SELECT rows, or take its result from the result cache. Results
+        are not cached inside transactions, as they may contain not committed changes.
+        @param tables: names of the tables the query reads
+        """
+        result_cache = self.result_cache
+        key = (rows.query, tuple(rows.params))
+        try:
+            hash(key)
+        except TypeError:
+            key = None
+        if tables is None or key is None or self._local.transaction_depth or not self.autocommit:
+            rows.execute_query()
+            return
+        values = result_cache.get(key)
+        if values is not None:
+            rows.values = values
+            return
+        version = result_cache.version
+        rows.execute_query()
+        result_cache.add(key, tables, rows.values, version, ttl)
@@ -8,6 +8,9 @@ class MysqlAdapter(GenericAdapter):
     """Adapter for MySql databases.
     """
     scheme = 'mysql'
+    # the driver puts values into the query, which must fit into `max_allowed_packet`
+    _MAX_QUERY_PARAMS = 65535
+    _MAX_QUERY_SIZE = 1024 * 1024
 
     def _connect(self, url, **kwargs):
         import pymysql
@@ -46,6 +49,23 @@ class MysqlAdapter(GenericAdapter):
             rendered_expressions.append('(' + self.render(expression) + ')')
         return 'CONCAT(' + ', '.join(rendered_expressions) + ')'
 
+    def _ON_CONFLICT(self, conflict_fields, update):
+        """ON DUPLICATE KEY UPDATE col_name1 = VALUES(col_name1), ...
+        MySql checks all unique indexes, the conflict fields are not used. `id` is passed to
+        LAST_INSERT_ID() for the driver to report it also for updated records.
+        """
+        sql_v = ''.join(
+            ', %s = %s' % (item[0].column.name, self.render(item[1], item[0]))
+            if isinstance(item, tuple) else ', %s = VALUES(%s)' % (item.column.name,
+                                                                   item.column.name)
+            for item in update)
+        return 'ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)' + sql_v
+
+    def _get_upsert_ids(self, cursor, rows_count):
+        """The id of one upserted record is known thanks to LAST_INSERT_ID(id).
+        """
+        return [cursor.lastrowid] if rows_count == 1 else None
+
     def get_tables(self):
         """Get list of tables (names) in this DB."""
         cursor = self.execute("SHOW TABLES")
@@ -0,0 +1,141 @@
+"""
+Pool of database connections shared by threads.
+"""
+import time
+import threading
+from collections import deque
+
+import dbw
+
+
+class ConnectionPool():
+    """A thread-safe pool of driver connections.
+    Keeps up to `size` idle connections for reuse. When all of them are checked out, up to
+    `max_overflow` additional connections are opened, which are closed when returned.
+    """
+    def __init__(self, connect_func, close_func, ping_func=None, size=5, max_overflow=10,
+                 timeout=30, idle_timeout=None):
+        """
+        @param connect_func: function which opens a new driver connection
+        @param close_func: function which closes a driver connection
+        @param ping_func: function which checks if a connection is still usable, returns bool
+        @param size: how many idle connections to keep in the pool
+        @param max_overflow: how many connections can be opened in addition to `size`
+        @param timeout: how many seconds to wait for a connection when all are checked out
+        @param idle_timeout: connections idle longer than this number of seconds are closed
+        """
+        self._connect = connect_func
+        self._close = close_func
+        self._ping = ping_func
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._idle = deque()  # [(connection, return_time),], most recently used at the end
+        self._count = 0  # number of open connections, idle and checked out
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def get(self):
+        """Check out a connection from the pool, opening a new one if needed.
+        """
+        while True:
+            connection = self._checkout()
+            if connection is None:  # there is a free slot for a new connection
+                try:
+                    return self._connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+            if self._ping is None or self._ping(connection):
+                return connection
+            dbw.logger.debug('Discarding a dead pooled connection')
+            self._discard(connection)
+
+    def _checkout(self):
+        """Take an idle connection, or reserve a slot for a new connection (return None),
+        waiting if the pool is exhausted.
+        """
+        deadline = time.time() + self.timeout
+        stale_connections = []
+        try:
+            with self._condition:
+                while True:
+                    if self._closed:
+                        raise dbw.AdapterError('The connection pool is closed.')
+                    if self.idle_timeout is not None:
+                        # the least recently used connections are at the start
+                        min_return_time = time.time() - self.idle_timeout
+                        while self._idle and self._idle[0][1] < min_return_time:
+                            stale_connections.append(self._idle.popleft()[0])
+                            self._count -= 1
+                    if self._idle:
+                        return self._idle.pop()[0]
+                    if self._count < self.size + self.max_overflow:
+                        self._count += 1
+                        return None
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise dbw.PoolTimeout(
+                            'No connection became available in %s seconds' % self.timeout)
+                    self._condition.wait(remaining)
+        finally:
+            for connection in stale_connections:
+                self._close(connection)
+
+    def put(self, connection):
+        """Return a checked out connection to the pool. What was not committed is rolled back.
+        """
+        try:
+            connection.rollback()
+        except Exception:
+            self._discard(connection)
+            return
+        with self._condition:
+            if not self._closed and len(self._idle) < self.size:
+                self._idle.append((connection, time.time()))
+                self._condition.notify()
+                return
+        self._discard(connection)
+
+    def _discard(self, connection):
+        """Close a checked out connection, freeing its slot.
+        """
+        try:
+            self._close(connection)
+        finally:
+            self._release_slot()
+
+    def _release_slot(self):
+        with self._condition:
+            self._count -= 1
+            self._condition.notify()
+
+    def close(self):
+        """Close idle connections. Connections which are checked out are closed when returned.
+        """
+        with self._condition:
+            self._closed = True
+            idle_connections = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._count -= len(idle_connections)
+            self._condition.notify_all()
+        for connection in idle_connections:
+            self._close(connection)
+
+
+class _ConnectionLease():
+    """A connection checked out from a pool for a thread. The connection is returned to the pool
+    when the lease is released, or when it is garbage collected after the thread ends.
+    """
+    def __init__(self, pool):
+        self.pool = pool
+        self.connection = pool.get()
+
+    def release(self):
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            self.pool.put(connection)
+
+    def __del__(self):
+        self.release()
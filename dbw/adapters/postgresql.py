@@ -1,15 +1,81 @@
 import re
+import time
 import math
+import itertools
 from datetime import datetime as DateTime
+from collections import OrderedDict
 
 import dbw
-from . import Column, GenericAdapter
+from . import Column, GenericAdapter, PlanNode, QueryPlan
+
+
+FORMAT_PLACEHOLDER_REGEX = re.compile(r'%%|%s')
+# characters which have to be escaped in COPY text format
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def number_placeholders(query):
+    """Convert '%s' placeholders in a query to '$1', '$2', ...
+    """
+    placeholder_numbers = itertools.count(1)
+    return FORMAT_PLACEHOLDER_REGEX.sub(
+        lambda match: '%' if match.group() == '%%' else '$%i' % next(placeholder_numbers), query)
+
+
+class _CopyBuffer():
+    """File-like object for COPY ... FROM STDIN, which produces the data in COPY text format from
+    the given rows as the driver reads it, keeping in memory only a chunk of the data.
+    """
+    def __init__(self, rows):
+        """
+        @param rows: iterable of lists of values in COPY text format
+        """
+        self._rows = iter(rows)
+        self._buffer = ''
+        self.rows_count = 0
+
+    def read(self, size=-1):
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while size < 0 or length < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = '\t'.join(row) + '\n'
+            chunks.append(line)
+            length += len(line)
+            self.rows_count += 1
+        data = ''.join(chunks)
+        if size < 0:
+            size = len(data)
+        self._buffer = data[size:]
+        return data[:size]
+
+    readline = read
 
 
 class PostgreSqlAdapter(GenericAdapter):
     """Adapter for PostgreSql databases.
     """
     scheme = 'postgresql'
+    # after how many executions of a query template it is prepared on the server;
+    # None - do not use prepared statements
+    prepare_threshold = 5
+    _MAX_PREPARED_STATEMENTS = 100  # how many prepared statements to keep per connection
+    _MAX_QUERY_PARAMS = 65535  # parameters of a prepared statement are numbered with int16
+    _NULLS_LAST = True
+    # whether streamed SELECTs use named (server side) cursors; outside of a `transaction()` block
+    # the server materializes the whole result before the rows are fetched, so stream big results
+    # inside a transaction
+    server_side_cursors = True
+
+    def __init__(self, *args, **kwargs):
+        # prepared statements live as long as the connection
+        self._prepared_statements = {}  # {connection: OrderedDict(query: statement_name)}
+        self._query_uses = OrderedDict()  # {query: number of executions}
+        self._statement_numbers = itertools.count(1)
+        self._cursor_numbers = itertools.count(1)
+        super().__init__(*args, **kwargs)
 
     def _connect(self, url, **kwargs):
         import psycopg2
@@ -34,6 +100,143 @@ class PostgreSqlAdapter(GenericAdapter):
 #        connection.execute("SET sql_mode='NO_BACKSLASH_ESCAPES';")
         return connection
 
+    def _close_connection(self, connection):
+        self._prepared_statements.pop(connection, None)
+        super()._close_connection(connection)
+
+    def _execute(self, cursor, query, args):
+        """Execute frequently used query templates as server side prepared statements, so the
+        server does not parse and plan them each time.
+        """
+        if args and self.prepare_threshold and cursor.name is None:  # not a named cursor
+            statement_name = self._get_prepared_statement(cursor, query)
+            if statement_name:
+                query = 'EXECUTE %s (%s)' % (statement_name, ', '.join(['%s'] * len(args)))
+        cursor.execute(query, args)
+
+    def _execute_stream(self, query, params, batch_size):
+        """Execute the query with a named (server side) cursor, so that the results are kept on
+        the server and only `batch_size` rows at a time are transferred to the client.
+        Inside a `transaction()` block the cursor lives until the end of the transaction.
+        Outside of it the cursor is declared `WITH HOLD` to survive commits, and the server
+        materializes the results when the transaction which declared it is committed, i.e. right
+        away - the memory on the client is saved, but the server reads the whole result first.
+        """
+        if not self.server_side_cursors:
+            return super()._execute_stream(query, params, batch_size)
+        with self._lock:
+            cursor_name = 'dbw_cursor_%i' % next(self._cursor_numbers)
+        cursor = self._get_connection().cursor(
+            name=cursor_name, withhold=not self._local.transaction_depth)
+        cursor.itersize = batch_size
+        return self.execute(query, *params, cursor=cursor)
+
+    def _close_stream(self, cursor):
+        """Close the cursor. Closing a `WITH HOLD` cursor outside of a transaction may start one
+        (depending on the driver version), it is committed like other queries.
+        """
+        cursor.close()
+        if (cursor.withhold and self.autocommit and not self._local.transaction_depth
+                and cursor.connection.get_transaction_status()
+                != self.driver.extensions.TRANSACTION_STATUS_IDLE):
+            self.commit()
+
+    def _get_query_plan(self, query, args):
+        """@return: plan from EXPLAIN (FORMAT JSON), parsed by the driver
+        """
+        connection = self._get_connection()
+        cursor = connection.cursor()
+        if connection.get_transaction_status() == self.driver.extensions.TRANSACTION_STATUS_IDLE:
+            # end the transaction which EXPLAIN starts, so the connection is not left idle in it
+            try:
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + query, args)
+                return cursor.fetchone()[0]
+            finally:
+                connection.rollback()
+        # a failed statement aborts the whole transaction, so explain inside a savepoint
+        cursor.execute('SAVEPOINT dbw_explain')
+        try:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + query, args)
+            plan = cursor.fetchone()[0]
+        except self.driver.Error:
+            cursor.execute('ROLLBACK TO SAVEPOINT dbw_explain')
+            raise
+        finally:
+            cursor.execute('RELEASE SAVEPOINT dbw_explain')
+        return plan
+
+    def _parse_query_plan(self, query, plan):
+        nodes = []
+
+        def parse_node(node):
+            table = node.get('Relation Name')
+            if table is not None:
+                index = node.get('Index Name')
+                if index is None and node['Node Type'] == 'Bitmap Heap Scan':
+                    # the indexes are in the child Bitmap Index Scan nodes
+                    index = ', '.join(child['Index Name'] for child in node.get('Plans', [])
+                                      if 'Index Name' in child) or None
+                # an index scan without a condition reads the whole index, e.g. for ordering
+                full_scan = index is None or (node['Node Type'] in ('Index Scan', 'Index Only Scan')
+                                              and 'Index Cond' not in node)
+                nodes.append(PlanNode(table, index=index, full_scan=full_scan,
+                                      rows=node.get('Plan Rows'), detail=node['Node Type']))
+            for child in node.get('Plans', []):
+                parse_node(child)
+
+        top_node = plan[0]['Plan']
+        parse_node(top_node)
+        return QueryPlan(query, nodes, rows=top_node.get('Plan Rows'), raw=plan)
+
+    def _get_prepared_statement(self, cursor, query):
+        """Get name of the prepared statement for the query template. The query is prepared when
+        it was executed `prepare_threshold` times. When there are too many prepared statements
+        the least recently used one is deallocated.
+        @return: statement name or None if the query should be executed as is
+        """
+        # a connection is used only by one thread at a time
+        prepared_statements = self._prepared_statements.get(cursor.connection)
+        if prepared_statements is None:
+            prepared_statements = self._prepared_statements[cursor.connection] = OrderedDict()
+        statement_name = prepared_statements.get(query)
+        if statement_name is not None:
+            prepared_statements.move_to_end(query)
+            return statement_name
+
+        query_uses = self._query_uses
+        with self._lock:
+            uses = query_uses.pop(query, 0)
+            if uses >= 0:
+                uses += 1
+                if uses >= self.prepare_threshold and not query.lstrip()[:6].upper() in (
+                        'SELECT', 'INSERT', 'UPDATE', 'DELETE'):
+                    uses = -1
+            query_uses[query] = uses
+            if len(query_uses) > self._MAX_PREPARED_STATEMENTS * 10:
+                query_uses.popitem(last=False)
+        if uses < self.prepare_threshold:  # negative - the query cannot be prepared
+            return None
+
+        statement = number_placeholders(query)
+        statement_name = 'dbw_%i' % next(self._statement_numbers)
+        # a failed statement aborts the whole transaction, so prepare inside a savepoint
+        cursor.execute('SAVEPOINT dbw_prepare')
+        try:
+            cursor.execute('PREPARE %s AS %s' % (statement_name, statement))
+        except self.driver.Error as exc:
+            cursor.execute('ROLLBACK TO SAVEPOINT dbw_prepare')
+            dbw.logger.debug('Could not prepare the query: %s\n%s', query, exc)
+            with self._lock:
+                query_uses[query] = -1
+            return None
+        cursor.execute('RELEASE SAVEPOINT dbw_prepare')
+
+        prepared_statements[query] = statement_name
+        if len(prepared_statements) > self._MAX_PREPARED_STATEMENTS:
+            _, old_statement_name = prepared_statements.popitem(last=False)
+            cursor.execute('DEALLOCATE %s' % old_statement_name)
+        return statement_name
+
     def _declare_INT(self, column, int_map=((2, 'SMALLINT'), (4, 'INTEGER'), (8, 'BIGINT'))):
         """Render declaration of INT column type.
         """
@@ -94,7 +297,7 @@ class PostgreSqlAdapter(GenericAdapter):
         if isinstance(value, str):
             return DateTime.strptime(value, '%Y-%m-%d %H:%M:%S.%f')
         if isinstance(value, DateTime):
-            return value.strftime("'%Y-%m-%d %H:%M:%S.%f'")
+            return value
         raise SyntaxError('Expected datetime.datetime')
 
     def _decode_DATETIME(self, value, column):
@@ -204,13 +407,103 @@ class PostgreSqlAdapter(GenericAdapter):
             columns[column.name] = column
         return columns
 
-    def insert(self, *fields):
+    def _insert(self, *fields):
         """Overriden to add `RETURNING id`.
         """
-        query = self._insert(*fields) + ' RETURNING id'
-        cursor = self.execute(query)
+        return super()._insert(*fields) + ' RETURNING id'
+
+    def _get_last_insert_id(self, cursor):
         return cursor.fetchone()[0]
 
+    def _insert_many(self, fields, rows, upsert=None):
+        """Overriden to add `RETURNING id`.
+        """
+        return super()._insert_many(fields, rows, upsert) + ' RETURNING id'
+
+    def _get_last_insert_ids(self, cursor, rows_count):
+        return [row[0] for row in cursor.fetchall()]
+
+    _get_upsert_ids = _get_last_insert_ids
+
+    def _update_many(self, key, fields, rows):
+        """Overridden to join the table with the list of values:
+        UPDATE table_name SET col_name1 = dbw_values.col_name1, ...
+          FROM (SELECT key_name, col_name1, ... FROM table_name WHERE false
+            UNION ALL VALUES (key1, expression1_1, ...), ...) AS dbw_values
+          WHERE table_name.key_name = dbw_values.key_name
+        The empty SELECT gives the types of the table columns to the values.
+        """
+        fields = [key] + list(fields)
+        columns = ', '.join(field.column.name for field in fields)
+        values = ', '.join(
+            '(%s)' % ', '.join(self.render(value, field) for field, value in zip(fields, row))
+            for row in rows)
+        sql_v = ', '.join('%s = dbw_values.%s' % (field.column.name, field.column.name)
+                          for field in fields[1:])
+        return ('UPDATE %s SET %s FROM (SELECT %s FROM %s WHERE false UNION ALL VALUES %s) '
+                'AS dbw_values WHERE %s.%s = dbw_values.%s' % (
+                    key.model, sql_v, columns, key.model, values, key.model, key.column.name,
+                    key.column.name))
+
+    def _copy_value(self, value, field):
+        """Present a value for COPY text format, encoded the same way as for INSERT.
+        """
+        if value is None:
+            return '\\N'
+        value = self._encode(value, field)
+        if value is None:
+            return '\\N'
+        elif isinstance(value, bool):
+            return 't' if value else 'f'
+        elif isinstance(value, bytes):
+            value = '\\x' + value.hex()
+        else:
+            value = str(value)
+        return value.translate(COPY_ESCAPES)
+
+    def copy_from(self, fields, rows, buffer_size=65536):
+        """Insert many records using `COPY ... FROM STDIN`, which is much faster than INSERT
+        queries. The data is streamed to the db in chunks, so `rows` can be a generator of any
+        length.
+        @param fields: a model, or list of fields of one model
+        @param rows: iterable of sequences of values for the fields, or of records of the model
+        @param buffer_size: size of the chunks in which the data is sent to the db
+        @return: number of inserted rows
+        """
+        model_fields, indexes = self._get_insert_fields(fields)
+        fields = [model_fields[i] for i in indexes]
+        attr_names = [field._name if isinstance(field, dbw.RelatedRecordField) else field.name
+                      for field in fields]
+
+        def get_copy_rows():
+            for row in rows:
+                if isinstance(row, dbw.Model):
+                    values = [getattr(row, attr_name) for attr_name in attr_names]
+                elif len(row) != len(model_fields):
+                    raise dbw.QueryError('Expected %i values in a row, got %i.'
+                                         % (len(model_fields), len(row)))
+                else:
+                    values = [row[i] for i in indexes]
+                yield [self._copy_value(value, field) for value, field in zip(values, fields)]
+
+        query = 'COPY %s (%s) FROM STDIN' % (
+            fields[0].model, ', '.join(field.column.name for field in fields))
+        dbw.sql_logger.debug(query)
+        buffer = _CopyBuffer(get_copy_rows())
+        cursor = self._get_connection().cursor()
+        start_time = time.time()
+        try:
+            cursor.copy_expert(query, buffer, size=buffer_size)
+            if self.autocommit:
+                self.commit()
+        except Exception:
+            dbw.logger.warning('The failed query: %s', query)
+            raise
+        if self.result_cache is not None:
+            self._invalidate_results(query)
+        self._log_query(query, start_time, time.time(), buffer.rows_count)
+        return buffer.rows_count
+
     def _drop_table(self, table_name):
         """Return query for dropping a table.
         @param table_name: table name or a model describing the table
@@ -0,0 +1,148 @@
+"""
+Cache of SELECT query results.
+"""
+import re
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+
+# queries which do not change data
+READ_QUERY_REGEX = re.compile(
+    r'\s*(SELECT|EXPLAIN|SHOW|PRAGMA|SET|RESET|BEGIN|START|COMMIT|ROLLBACK|SAVEPOINT|RELEASE)\b',
+    re.IGNORECASE)
+# queries which change data of one table, the table name is the last group
+WRITE_QUERY_REGEX = re.compile(
+    r'\s*(INSERT(\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(\s+OR\s+\w+)?|DELETE\s+FROM|COPY'
+    r'|TRUNCATE(\s+TABLE)?|(CREATE|DROP|ALTER)\s+TABLE(\s+IF\s+(NOT\s+)?EXISTS)?)'
+    r'\s+([\w.`"]+)', re.IGNORECASE)
+
+
+def _get_size(values):
+    """Estimate the memory taken by rows of values.
+    """
+    size = sys.getsizeof(values)
+    for row in values:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+    return size
+
+
+class _CacheEntry():
+    __slots__ = ('values', 'tables', 'size', 'expires')
+
+    def __init__(self, values, tables, size, expires):
+        self.values = values
+        self.tables = tables
+        self.size = size
+        self.expires = expires
+
+
+class ResultCache():
+    """Thread-safe cache of decoded rows returned by SELECT queries, for an adapter's
+    `result_cache` attribute. The results are dropped when the tables they were read from are
+    changed through the adapter, the least recently used ones - when the cache is full.
+    Changes made by other processes are not noticed, use `ttl` to limit how long they can be
+    missed.
+    """
+    def __init__(self, max_entries=1000, max_bytes=10 * 2 ** 20, ttl=None):
+        """
+        @param max_entries: max number of cached query results
+        @param max_bytes: max estimated size of the cached results
+        @param ttl: number of seconds to keep a result; None - until it is invalidated or evicted
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0  # estimated size of the cached results
+        self.hits = 0
+        self.misses = 0
+        # incremented on each invalidation, so that results read before it are not cached
+        self.version = 0
+        self._entries = OrderedDict()  # {(query, params): _CacheEntry}, least recently used first
+        self._tables = {}  # {table_name: set of keys of the results read from it}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Get cached rows of a query.
+        @param key: tuple (query, params)
+        @return: list of rows, or None if the result is not cached; the rows are copies, so the
+            cached result is not changed through them
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires is not None and entry.expires < time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return [list(row) for row in entry.values]
+
+    def add(self, key, tables, values, version, ttl=None):
+        """Cache rows of a query.
+        @param tables: names of the tables the query reads
+        @param version: `version` of the cache before the query was executed; the result is not
+            cached if the cache was invalidated meanwhile
+        @param ttl: number of seconds to keep the result instead of the cache `ttl`
+        """
+        values = [tuple(row) for row in values]  # not changed by the callers
+        size = _get_size(values)
+        if size > self.max_bytes:
+            return
+        ttl = ttl or self.ttl
+        expires = None if ttl is None else time.time() + ttl
+        tables = frozenset(table.lower() for table in tables)
+        with self._lock:
+            if version != self.version:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _CacheEntry(values, tables, size, expires)
+            self.size += size
+            for table in tables:
+                self._tables.setdefault(table, set()).add(key)
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.size -= entry.size
+        for table in entry.tables:
+            keys = self._tables[table]
+            keys.discard(key)
+            if not keys:
+                del self._tables[table]
+
+    def invalidate(self, tables=None):
+        """Drop the results read from the tables.
+        @param tables: table names or models; None - drop all results
+        """
+        with self._lock:
+            self.version += 1
+            if tables is None:
+                self._entries.clear()
+                self._tables.clear()
+                self.size = 0
+                return
+            for table in tables:
+                for key in list(self._tables.get(str(table).lower(), ())):
+                    self._remove(key)
+
+    def get_written_tables(self, query):
+        """Find out which tables a query can change.
+        @return: list of table names, empty for queries which do not change data, None if the
+            tables are not known
+        """
+        match = WRITE_QUERY_REGEX.match(query)
+        if match:
+            table = match.group(match.lastindex).rpartition('.')[2]
+            return [table.strip('`"')]
+        if READ_QUERY_REGEX.match(query):
+            return []
+        return None
@@ -0,0 +1,123 @@
+import re
+import threading
+import contextlib
+
+import dbw
+from . import GenericAdapter
+
+
+# queries which only read data and can be executed on a replica
+READ_QUERY_REGEX = re.compile(r'\s*(SELECT|EXPLAIN)\b(?!.*\bFOR\s+(UPDATE|SHARE)\b)',
+                              re.IGNORECASE | re.DOTALL)
+
+
+class _AdapterProxy(GenericAdapter):
+    """Base of adapters which execute queries through other adapters. Attributes which the proxy
+    classes do not define (rendering of queries, db specific declarations and decoding, ...) are
+    taken from the adapter in `db` attribute.
+    """
+    _own_attrs = frozenset()  # names of the attributes defined by the proxy classes
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._own_attrs = frozenset(name for klass in cls.__mro__
+                                   if issubclass(klass, _AdapterProxy) for name in klass.__dict__)
+
+    def __getattribute__(self, name):
+        if name.startswith('__') or name in type(self)._own_attrs:
+            return object.__getattribute__(self, name)
+        instance_dict = object.__getattribute__(self, '__dict__')
+        if name in instance_dict:
+            return instance_dict[name]
+        return getattr(instance_dict['db'], name)
+
+    def connect(self, *args, **kwargs):
+        raise dbw.AdapterError('Connect the adapters used by the proxy instead.')
+
+
+class RoutingAdapter(_AdapterProxy):
+    """Adapter which splits reads and writes between a primary db and its replicas. SELECT queries
+    are executed on the replica with the least queries in progress (in turn among equally busy
+    ones), other queries - on the primary. Reads inside a transaction, or when the primary is not
+    in autocommit mode, are executed on the primary, so they see its uncommitted changes.
+    Writes, rendering of queries and everything else are done by the primary adapter.
+    """
+    def __init__(self, primary, replicas=()):
+        """
+        @param primary: connected adapter of the primary db
+        @param replicas: connected adapters of the replica dbs of the same type; with no replicas
+            all queries are executed on the primary
+        """
+        for db in (primary,) + tuple(replicas):
+            if not isinstance(db, GenericAdapter):
+                raise dbw.AdapterError('Expected GenericAdapter instances.')
+        self.db = self.primary = primary
+        self.replicas = list(replicas)
+        self._outstanding = [0] * len(self.replicas)  # number of queries in progress on replicas
+        self._next_replica = 0
+        self._replica_lock = threading.Lock()
+
+    def disconnect(self):
+        for db in [self.primary] + self.replicas:
+            db.disconnect()
+
+    def _is_sticky(self):
+        """Whether reads must be executed on the primary.
+        """
+        primary = self.primary
+        return bool(primary._local.transaction_depth) or not primary.autocommit
+
+    @contextlib.contextmanager
+    def _read_db(self):
+        """Context manager choosing the adapter for executing a read query.
+        """
+        if not self.replicas or self._is_sticky():
+            yield self.primary
+            return
+        outstanding = self._outstanding
+        with self._replica_lock:
+            count = len(outstanding)
+            start = self._next_replica
+            replica_no = min(((start + i) % count for i in range(count)),
+                             key=outstanding.__getitem__)
+            self._next_replica = (replica_no + 1) % count
+            outstanding[replica_no] += 1
+        try:
+            yield self.replicas[replica_no]
+        finally:
+            with self._replica_lock:
+                outstanding[replica_no] -= 1
+
+    def execute(self, query, *args, cursor=None):
+        """Execute a query: a read query - on a replica, other queries - on the primary.
+        @param cursor: cursor to execute the query with; the query is executed on the adapter
+            which created the cursor, which must be the primary
+        @return: cursor object
+        """
+        if cursor is None and READ_QUERY_REGEX.match(query):
+            with self._read_db() as db:
+                return db.execute(query, *args)
+        return self.primary.execute(query, *args, cursor=cursor)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Transaction on the primary, see `GenericAdapter.transaction`. Queries made through the
+        router inside the block, including reads, are executed on the primary.
+        """
+        with self.primary.transaction():
+            yield self
+
+    def select(self, *fields, get_query=False, **kwargs):
+        """Execute SELECT query on a replica, see `GenericAdapter.select`.
+        @return: Rows instance bound to the adapter which executed the query
+        """
+        if get_query:
+            return self.primary.select(*fields, get_query=True, **kwargs)
+        with self._read_db() as db:
+            return db.select(*fields, **kwargs)
+
+    def explain(self, *fields, **kwargs):
+        """Get the plan of a SELECT query on a replica, see `GenericAdapter.explain`.
+        """
+        with self._read_db() as db:
+            return db.explain(*fields, **kwargs)
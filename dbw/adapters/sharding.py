@@ -0,0 +1,340 @@
+import zlib
+import contextlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import dbw
+from . import GenericAdapter
+from .generic import _find_field_values
+from .routing import _AdapterProxy
+
+
+# functions combining results of aggregate functions from the shards
+_AGGREGATES = {'_COUNT': sum, '_SUM': sum, '_MIN': min, '_MAX': max}
+
+
+def _combine(func, values):
+    values = [value for value in values if value is not None]
+    return func(values) if values else None
+
+
+class ShardedAdapter(_AdapterProxy):
+    """Adapter which distributes records of models among several databases (shards) of the same
+    type by values of the shard key, declared with `ModelOptions(shard_key=...)`. Tables of models
+    without a shard key are kept in the first shard.
+    Inserts are routed by the shard key value, updates and deletes - by the shard key value found
+    in the condition (or, for updates, in the new values), otherwise they are executed on all
+    shards. SELECT queries which are not restricted to one shard are executed on all shards in
+    parallel and their results are merged: ordered, limited and re-aggregated (COUNT, SUM, MIN,
+    MAX) globally.
+    Ids are generated by each shard, so they are unique only within a shard. The shard key of a
+    record must not be changed. Queries given to `execute` are executed on all shards, e.g. to
+    create tables.
+    """
+    def __init__(self, shards, max_workers=None):
+        """
+        @param shards: connected adapters of the shard dbs; their order must not change, as it
+            defines which records are kept in which shard
+        @param max_workers: max number of threads executing queries on the shards in parallel
+        """
+        if not shards:
+            raise dbw.AdapterError('Pass at least one shard.')
+        for db in shards:
+            if not isinstance(db, GenericAdapter):
+                raise dbw.AdapterError('Expected GenericAdapter instances.')
+        self.shards = list(shards)
+        self.db = self.shards[0]  # renders queries and keeps tables of not sharded models
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or len(self.shards))
+
+    def disconnect(self):
+        for db in self.shards:
+            db.disconnect()
+        self._executor.shutdown()
+
+    def get_shard_no(self, value):
+        """Get number of the shard which keeps records with the given shard key value. Integers
+        are distributed by modulo, other values - by CRC32 of their string presentation.
+        """
+        if isinstance(value, dbw.Model):  # related record
+            value = value.id
+        if isinstance(value, int):
+            return value % len(self.shards)
+        return zlib.crc32(str(value).encode()) % len(self.shards)
+
+    def _find_shard_nos(self, expression, key_field):
+        """Find the shards to which a condition restricts records by the shard key.
+        @return: set of shard numbers, or None if the condition does not restrict them
+        """
+        values = _find_field_values(expression, key_field)
+        if values is None:
+            return None
+        return {self.get_shard_no(value) for value in values}
+
+    def _get_shards(self, models, where, values=()):
+        """Get the shards which may keep records of models matching a condition.
+        @param values: tuples (Field, value) - new values of the records to update
+        @return: list of adapters
+        """
+        shard_nos = None
+        is_sharded = False
+        for model in models:
+            key_field = model._meta.shard_key
+            if key_field is None:
+                continue
+            is_sharded = True
+            model_shard_nos = self._find_shard_nos(where, key_field)
+            if model_shard_nos is None:
+                model_shard_nos = {self.get_shard_no(value) for field, value in values
+                                   if field is key_field} or None
+            if model_shard_nos is not None:
+                shard_nos = model_shard_nos if shard_nos is None else shard_nos & model_shard_nos
+        if not is_sharded:
+            return [self.db]
+        if shard_nos is None:
+            return self.shards
+        return [self.shards[shard_no] for shard_no in sorted(shard_nos)]
+
+    def _get_model_shard(self, model, fields):
+        """Get the shard where to insert a record.
+        @param fields: tuples (Field, value)
+        """
+        key_field = model._meta.shard_key
+        if key_field is None:
+            return self.db
+        for field, value in fields:
+            if field is key_field:
+                return self.shards[self.get_shard_no(value)]
+        raise dbw.QueryError('Pass value of the shard key `%s`.' % key_field)
+
+    def _split_rows(self, fields, rows):
+        """Distribute rows of values for a multi-row insert among the shards.
+        @return: list of tuples (shard, rows of the shard, positions of the rows in `rows`)
+        """
+        model_fields, _ = self._get_insert_fields(fields)
+        key_field = model_fields[0].model._meta.shard_key
+        if key_field is None:
+            rows = list(rows)
+            return [(self.db, rows, range(len(rows)))]
+        for key_no, field in enumerate(model_fields):
+            if field is key_field:
+                break
+        else:
+            raise dbw.QueryError('Pass values of the shard key `%s`.' % key_field)
+        shard_rows = [([], []) for _ in self.shards]
+        for i, row in enumerate(rows):
+            _rows, positions = shard_rows[self.get_shard_no(row[key_no])]
+            _rows.append(row)
+            positions.append(i)
+        return [(shard, _rows, positions)
+                for shard, (_rows, positions) in zip(self.shards, shard_rows) if _rows]
+
+    def _get_identity_map(self):
+        """Records are not kept in an identity map, as ids are not unique across the shards.
+        """
+        return None
+
+    def _get_record_cache(self, model):
+        """Records are not cached, as ids are not unique across the shards.
+        """
+        return None
+
+    def _gather(self, func, items):
+        """Call a function for each of the items (shards, or tuples with the shard first), in
+        parallel unless in a transaction, whose connections are bound to the current thread.
+        @return: list of the results
+        """
+        if len(items) == 1 or any(db._local.transaction_depth for db in self.shards):
+            return [func(item) for item in items]
+        return list(self._executor.map(func, items))
+
+    def _gather_ids(self, func, fields, rows):
+        """Insert rows into their shards.
+        @param func: function(shard, rows) inserting the rows and returning their ids
+        @return: list of the ids in the order of the rows, or None if some shard cannot tell them
+        """
+        parts = self._split_rows(fields, rows)
+        results = self._gather(lambda part: func(part[0], part[1]), parts)
+        if any(ids is None for ids in results):
+            return None
+        ids = [None] * sum(len(positions) for _, _, positions in parts)
+        for (_, _, positions), part_ids in zip(parts, results):
+            for position, id in zip(positions, part_ids):
+                ids[position] = id
+        return ids
+
+    def execute(self, query, *args, cursor=None):
+        """Execute a query on all shards.
+        @return: cursor of the first shard
+        """
+        if cursor is not None:
+            raise dbw.QueryError('Queries are executed with cursors of the shards.')
+        return self._gather(lambda db: db.execute(query, *args), self.shards)[0]
+
+    def commit(self):
+        for db in self.shards:
+            db.commit()
+
+    def rollback(self):
+        for db in self.shards:
+            db.rollback()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Transaction on each of the shards, see `GenericAdapter.transaction`. The transactions
+        are committed one after another, so they are not atomic across the shards.
+        """
+        with contextlib.ExitStack() as stack:
+            for db in self.shards:
+                stack.enter_context(db.transaction())
+            yield self
+
+    def insert(self, *fields, get_query=False):
+        if get_query:
+            return self.db.insert(*fields, get_query=True)
+        if not fields:
+            raise dbw.QueryError('Pass tuples with 2 items: (field, value).')
+        db = self._get_model_shard(fields[0][0].model, fields)
+        return db.insert(*fields)
+
+    def insert_many(self, fields, rows, batch_size=None, get_ids=True):
+        """Insert many records into their shards, see `GenericAdapter.insert_many`.
+        """
+        return self._gather_ids(
+            lambda db, _rows: db.insert_many(fields, _rows, batch_size, get_ids), fields, rows)
+
+    def upsert(self, *fields, conflict=None, update=None, get_query=False):
+        if get_query:
+            return self.db.upsert(*fields, conflict=conflict, update=update, get_query=True)
+        if not fields:
+            raise dbw.QueryError('Pass tuples with 2 items: (field, value).')
+        db = self._get_model_shard(fields[0][0].model, fields)
+        return db.upsert(*fields, conflict=conflict, update=update)
+
+    def upsert_many(self, fields, rows, conflict=None, update=None, batch_size=None):
+        """Insert or update many records in their shards, see `GenericAdapter.upsert_many`.
+        """
+        return self._gather_ids(
+            lambda db, _rows: db.upsert_many(fields, _rows, conflict, update, batch_size),
+            fields, rows)
+
+    def update(self, *fields, where=None, limit=None, get_query=False):
+        if get_query:
+            return self.db.update(*fields, where=where, limit=limit, get_query=True)
+        if not fields:
+            raise dbw.QueryError('Pass tuples with 2 items: (field, value).')
+        shards = self._get_shards([fields[0][0].model], where, fields)
+        return sum(self._gather(lambda db: db.update(*fields, where=where, limit=limit), shards))
+
+    def update_many(self, model, fields, rows, key=None, batch_size=None):
+        """Update many records in their shards, see `GenericAdapter.update_many`. Records of a
+        sharded model can be identified only by the shard key.
+        """
+        key_field = model._meta.shard_key
+        if key_field is None:
+            return self.db.update_many(model, fields, rows, key, batch_size)
+        if isinstance(key, dbw.FieldExpression):
+            key = key.left
+        if key is not key_field:
+            raise dbw.QueryError('Records are identified by the shard key `%s`.' % key_field)
+        shard_rows = [[] for _ in self.shards]
+        for row in rows:
+            shard_rows[self.get_shard_no(row[0])].append(row)
+        parts = [(db, _rows) for db, _rows in zip(self.shards, shard_rows) if _rows]
+        return sum(self._gather(
+            lambda part: part[0].update_many(model, fields, part[1], key, batch_size), parts))
+
+    def delete(self, model, where, limit=None, get_query=False):
+        if get_query:
+            return self.db.delete(model, where, limit, get_query=True)
+        shards = self._get_shards([model], where)
+        return sum(self._gather(lambda db: db.delete(model, where, limit), shards))
+
+    def _get_select_models(self, fields, from_):
+        """Get the models a SELECT query reads.
+        """
+        models = []
+        for arg in dbw.listify(from_) if from_ else fields:
+            model = getattr(arg, 'model', arg)
+            if dbw.is_model(model) and model not in models:
+                models.append(model)
+        return models
+
+    def select(self, *fields, from_='', where='', orderby='', limit=None, distinct='',
+               groupby='', having='', get_query=False, stream=False, batch_size=1000,
+               columnar=False):
+        """Execute SELECT query, see `GenericAdapter.select`. A query restricted to one shard is
+        executed on it, otherwise the rows from all shards are merged, and are not streamed.
+        Results of aggregate functions are combined for the rows with equal values of the other
+        selected fields, which must include the fields the rows are grouped by.
+        @return: Rows instance
+        """
+        kwargs = dict(from_=from_, where=where, distinct=distinct, groupby=groupby, having=having)
+        if get_query:
+            return self.db.select(*fields, orderby=orderby, limit=limit, get_query=True, **kwargs)
+        shards = self._get_shards(self._get_select_models(fields, from_), where)
+        if len(shards) == 1:
+            return shards[0].select(*fields, orderby=orderby, limit=limit, stream=stream,
+                                    batch_size=batch_size, columnar=columnar, **kwargs)
+
+        if columnar:
+            raise dbw.QueryError('Columnar results are not merged from several shards.')
+        if having or distinct not in ('', False, True):
+            raise dbw.QueryError('HAVING and DISTINCT ON are not supported across shards.')
+        operations = [getattr(field, 'operation', None) for field in fields]
+        for field, operation in zip(fields, operations):
+            if operation == '_AVG' or operation == '_COUNT' and getattr(field, 'distinct', False):
+                raise dbw.QueryError('AVG and COUNT(DISTINCT) cannot be combined from shards.')
+        is_aggregated = bool(groupby) or any(operation in _AGGREGATES for operation in operations)
+        offset, count = (0, limit) if isinstance(limit, int) or not limit else limit
+        # each shard returns enough rows for the global limit; groups are aggregated fully
+        shard_limit = offset + count if count and not is_aggregated else None
+
+        results = self._gather(lambda db: db.select(*fields, orderby=orderby, limit=shard_limit,
+                                                    **kwargs), shards)
+        rows = results[0]
+        values = [row for result in results for row in result]
+        if is_aggregated:
+            values = self._aggregate(values, operations)
+        if distinct:
+            values = list(OrderedDict.fromkeys(tuple(row) for row in values))
+        if orderby:
+            self._sort(rows, values, orderby)
+        if count:
+            values = values[offset:offset + count]
+        rows.values = values
+        return rows
+
+    def _aggregate(self, values, operations):
+        """Combine rows aggregated by each of the shards.
+        """
+        key_nos = [i for i, operation in enumerate(operations) if operation not in _AGGREGATES]
+        groups = OrderedDict()  # {values of not aggregated fields: [values of each field]}
+        for row in values:
+            key = tuple(row[i] for i in key_nos)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = [[] for _ in row]
+            for column, value in zip(group, row):
+                column.append(value)
+        return [[column[0] if operation not in _AGGREGATES
+                 else _combine(_AGGREGATES[operation], column)
+                 for operation, column in zip(operations, group)]
+                for group in groups.values()]
+
+    def _sort(self, rows, values, orderby):
+        """Sort merged rows. NULLs are placed like the shard db does it.
+        """
+        nulls_last = self._NULLS_LAST
+        for expression in reversed(dbw.listify(orderby)):
+            try:
+                field_no = rows._get_field_no(expression)
+            except KeyError:
+                raise dbw.QueryError('Rows from shards can be ordered only by selected fields.')
+            values.sort(key=lambda row: ((row[field_no] is None) == nulls_last, row[field_no]),
+                        reverse=getattr(expression, 'sort', 'ASC') == 'DESC')
+
+    def explain(self, *fields, from_='', where='', **kwargs):
+        """Get the plan of a SELECT query on the first of the shards it is executed on.
+        """
+        shards = self._get_shards(self._get_select_models(fields, from_), where)
+        return shards[0].explain(*fields, from_=from_, where=where, **kwargs)
@@ -5,16 +5,25 @@ from datetime import date as Date, datetime as DateTime, timedelta as TimeDelta
 from decimal import Decimal
 
 import dbw
-from . import Column, GenericAdapter
+from . import Column, GenericAdapter, PlanNode, QueryPlan
 
 
 FORMAT_QMARK_REGEX = re.compile(r'(?<!%)%s')
+# detail of a table read step in EXPLAIN QUERY PLAN output; not of reading a constant row or
+# subquery results (SCAN SUBQUERY 1 in old Sqlite versions)
+PLAN_READ_REGEX = re.compile(
+    r'^(?P<operation>SCAN|SEARCH)(?: TABLE)? (?!CONSTANT ROW$|SUBQUERY \d+$)(?P<table>\S+)'
+    r'(?: AS \S+)?'
+    r'(?: USING (?:(?:COVERING )?INDEX (?P<index>\S+)|(?P<primary>(?:INTEGER )?PRIMARY KEY)))?')
+# detail of a subquery step, whose results are read by the subquery name later in the plan
+PLAN_SUBQUERY_REGEX = re.compile(r'^(?:MATERIALIZE|CO-ROUTINE) (?P<name>\S+)')
 
 
 class SqliteAdapter(GenericAdapter):
     """Adapter for Sqlite databases.
     """
     scheme = 'sqlite'
+    _scaled_decimals = True
 
     def _connect(self, db_path, **kwargs):
         import sqlite3
@@ -29,13 +38,61 @@ class SqliteAdapter(GenericAdapter):
                 raise dbw.DbConnectionError(
                     '"%s" is not a file.\nFor a new database create an empty file.' % db_path)
             self.url = db_path
+        if self._pool is not None:
+            # pooled connections are used by different threads, though not simultaneously
+            kwargs.setdefault('check_same_thread', False)
 
         return sqlite3.connect(db_path, **kwargs)
 
-    def execute(self, query, *args):
-        # convert '%s' to '?' as sqlite client expects
-        query = FORMAT_QMARK_REGEX.sub('?', query).replace('%%', '%')
-        return super().execute(query, *args)
+    def _to_qmark(self, query):
+        """Convert '%s' placeholders to '?' as sqlite client expects.
+        """
+        return FORMAT_QMARK_REGEX.sub('?', query).replace('%%', '%')
+
+    def _execute(self, cursor, query, args):
+        cursor.execute(self._to_qmark(query), args)
+
+    def _get_query_plan(self, query, args):
+        """@return: rows of EXPLAIN QUERY PLAN: (id, parent_id, unused, detail)
+        """
+        cursor = self._get_connection().cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + self._to_qmark(query), args)
+        return cursor.fetchall()
+
+    def _parse_query_plan(self, query, plan):
+        """Sqlite tells which tables are scanned (SCAN) or searched using an index (SEARCH), but
+        does not estimate numbers of rows.
+        """
+        nodes = []
+        subqueries = set()
+        for row in plan:
+            detail = row[-1]
+            match = PLAN_SUBQUERY_REGEX.match(detail)
+            if match is not None:
+                subqueries.add(match.group('name'))
+                continue
+            match = PLAN_READ_REGEX.match(detail)
+            # not a table read, e.g. USE TEMP B-TREE FOR ORDER BY
+            if match is None or match.group('table') in subqueries:
+                continue
+            index = match.group('index') or match.group('primary')
+            nodes.append(PlanNode(match.group('table'), index=index,
+                                  full_scan=(match.group('operation') == 'SCAN'), detail=detail))
+        return QueryPlan(query, nodes, raw=plan)
+
+    def _begin(self):
+        """The driver starts a transaction implicitly only before INSERT/UPDATE/DELETE, but a
+        savepoint outside a transaction starts (and commits when released) its own transaction.
+        """
+        if not self._get_connection().in_transaction:
+            self.execute('BEGIN')
+
+    def _get_last_insert_ids(self, cursor, rows_count):
+        """Rows inserted by one statement get consecutive ids, as the db is locked for writing
+        during the statement.
+        """
+        last_id = cursor.lastrowid
+        return list(range(last_id - rows_count + 1, last_id + 1))
 
     def _truncate(self, model, mode=''):
         assert dbw.is_model(model)
@@ -0,0 +1,125 @@
+"""
+Statistics of executed queries.
+"""
+import re
+import bisect
+import functools
+import threading
+from collections import deque, OrderedDict
+
+
+# upper bounds (in seconds) of the buckets of query duration histograms
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+LITERAL_REGEX = re.compile(r"'(?:[^']|'')*'|(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])|%s|\?")
+LIST_REGEX = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*')
+SPACES_REGEX = re.compile(r'\s+')
+
+
+@functools.lru_cache(maxsize=1000)
+def get_fingerprint(query):
+    """Normalize a query, so that queries which differ only in values have the same fingerprint:
+    literals and placeholders are replaced with `?`, lists of them (IN lists, rows of VALUES) with
+    `(...)`, and whitespace is collapsed.
+    """
+    fingerprint = LITERAL_REGEX.sub('?', query)
+    fingerprint = LIST_REGEX.sub('(...)', fingerprint)
+    return SPACES_REGEX.sub(' ', fingerprint).strip()
+
+
+class _FingerprintStats():
+    """Statistics of queries with the same fingerprint.
+    """
+    __slots__ = ('calls', 'total_time', 'min_time', 'max_time', 'rows', 'histogram')
+
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0
+        self.min_time = None
+        self.max_time = 0
+        self.rows = 0
+        # number of queries in each duration bucket, the last one is for longer durations
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, duration, rows_count):
+        self.calls += 1
+        self.total_time += duration
+        if self.min_time is None or duration < self.min_time:
+            self.min_time = duration
+        if duration > self.max_time:
+            self.max_time = duration
+        if rows_count:
+            self.rows += rows_count
+        self.histogram[bisect.bisect_left(LATENCY_BUCKETS, duration)] += 1
+
+
+class QueryStats():
+    """Thread-safe statistics of executed queries, grouped by query fingerprints.
+    """
+    def __init__(self, max_recent=20, max_fingerprints=1000):
+        """
+        @param max_recent: how many recently executed queries to keep
+        @param max_fingerprints: for how many fingerprints to keep statistics; statistics of the
+            least recently executed ones are dropped
+        """
+        self.recent = deque(maxlen=max_recent)  # [(start_time, query, duration),]
+        self.max_fingerprints = max_fingerprints
+        self._fingerprints = OrderedDict()  # {fingerprint: _FingerprintStats}
+        self._lock = threading.Lock()
+
+    def add(self, query, start_time, duration, rows_count=None):
+        """Account an executed query.
+        @param rows_count: number of rows returned or affected by the query, if known
+        """
+        fingerprint = get_fingerprint(query)
+        with self._lock:
+            self.recent.append((start_time, query, duration))
+            stats = self._get_stats(fingerprint)
+            stats.add(duration, rows_count)
+
+    def add_rows(self, query, rows_count):
+        """Account rows of a query, whose number was known only after fetching them. The rows
+        are not accounted if statistics of the query were dropped since it was executed.
+        """
+        fingerprint = get_fingerprint(query)
+        with self._lock:
+            stats = self._fingerprints.get(fingerprint)
+            if stats is not None:
+                stats.rows += rows_count
+
+    def _get_stats(self, fingerprint):
+        fingerprints = self._fingerprints
+        stats = fingerprints.get(fingerprint)
+        if stats is None:
+            stats = fingerprints[fingerprint] = _FingerprintStats()
+            if len(fingerprints) > self.max_fingerprints:
+                fingerprints.popitem(last=False)
+        else:
+            fingerprints.move_to_end(fingerprint)
+        return stats
+
+    def get(self):
+        """Get the statistics, the most time consuming fingerprints first.
+        @return: list of dicts
+        """
+        with self._lock:
+            items = [(fingerprint, stats.calls, stats.total_time, stats.min_time, stats.max_time,
+                      stats.rows, list(stats.histogram))
+                     for fingerprint, stats in self._fingerprints.items()]
+        items.sort(key=lambda item: item[2], reverse=True)
+        return [{
+            'fingerprint': fingerprint,
+            'calls': calls,
+            'total_time': total_time,
+            'min_time': min_time,
+            'max_time': max_time,
+            'mean_time': total_time / calls,
+            'rows': rows,
+            # [(max_duration, number_of_queries),], None - longer than the last bucket
+            'histogram': list(zip(LATENCY_BUCKETS + (None,), histogram)),
+        } for fingerprint, calls, total_time, min_time, max_time, rows, histogram in items]
+
+    def reset(self):
+        with self._lock:
+            self.recent.clear()
+            self._fingerprints.clear()
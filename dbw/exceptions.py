@@ -17,6 +17,11 @@ class AdapterNotFound(AdapterError):
     """
 
 
+class PoolTimeout(AdapterError):
+    """No connection became available in the connection pool in time.
+    """
+
+
 class ModelError(DbwError):
     """A problem with a model.
     """
@@ -10,7 +10,8 @@ from . import models
 
 class ModelOptions(models.ModelAttr):
 
-    def __init__(self, db_name='', db_indexes=None, ordering=None, abstract=False):
+    def __init__(self, db_name='', db_indexes=None, ordering=None, abstract=False,
+                 shard_key=None, cache=False, cache_size=1000):
         """Model settings
         @param db_name: name of the corresponding table in the database
         @param ordering: The default ordering for DB rows. This is a tuple or list of fields.
@@ -21,6 +22,11 @@ class ModelOptions(models.ModelAttr):
             want to put some common information into a number of other models. You write your base
             class and put abstract=True in the _meta attribute. This model will then not be used to
             create any database table.
+        @param shard_key: field (or its name) by whose value the records are distributed among the
+            shards of a ShardedAdapter
+        @param cache: whether to keep records got by id in a process-wide cache, see RecordCache;
+            useful for rarely changed models
+        @param cache_size: max number of cached records
         """
         # TODO: add `proxy` option, similarly to Django?
         if abstract:
@@ -63,5 +69,18 @@ class ModelOptions(models.ModelAttr):
         self.db_indexes = db_indexes
         self.abstract = abstract
 
+        if isinstance(shard_key, str):
+            if shard_key not in self.fields:
+                raise dbw.ModelError('Shard key `%s` is not a field of the model.' % shard_key)
+            shard_key = self.fields[shard_key]
+        elif isinstance(shard_key, model_fields.FieldExpression):
+            shard_key = shard_key.left
+        assert shard_key is None or isinstance(shard_key, model_fields.ModelField)
+        self.shard_key = shard_key  # ModelField or None
 
-from . import model_fields, db_indexes as orm_indexes
+        self.record_cache = None
+        if cache and not abstract:
+            self.record_cache = record_cache.RecordCache(self._model_attr_info.model, cache_size)
+
+
+from . import model_fields, record_cache, db_indexes as orm_indexes
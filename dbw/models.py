@@ -202,7 +202,8 @@ class Model(metaclass=ModelType):
         @param *args: tuples (ModelField or field_name, value)
         @param **kwargs: {field_name: fieldValue}
         """
-        if not (isinstance(db, adapters.GenericAdapter) or db is None):
+        if not (isinstance(db, (adapters.GenericAdapter, adapters.AsyncGenericAdapter))
+                or db is None):
             raise exceptions.RecordError('`db` should be a GenericAdapter instance')
         self._db = db
 
@@ -264,8 +265,19 @@ class Model(metaclass=ModelType):
         model = self.__class__
         model.objects.check_table(db)
         signals.pre_delete.send(sender=model, record=self)
-        db.delete(model, where=(model.id == self.id))
+        where = (model.id == self.id)
+        shard_key = model._meta.shard_key
+        if shard_key is not None:  # tells a ShardedAdapter the shard of the record
+            if isinstance(shard_key, model_fields.RelatedRecordField):
+                value = getattr(self, shard_key._name)
+            else:
+                value = self[shard_key]
+            where = where & (model_fields.FieldExpression(shard_key) == value)
+        db.delete(model, where=where)
         db.commit()
+        identity_map = db._get_identity_map()
+        if identity_map is not None:
+            identity_map.pop((model, self.id), None)
         signals.post_delete.send(sender=model, record=self)
         self.id = None
 
@@ -289,6 +301,9 @@ class Model(metaclass=ModelType):
         is_new = not self.id
         if is_new:  # new record
             self.id = db.insert(*values)
+            identity_map = db._get_identity_map()
+            if identity_map is not None:
+                identity_map[(model, self.id)] = self
         else:  # existing record
             rows_count = db.update(*values, where=(model.id == self.id))
             if not rows_count:
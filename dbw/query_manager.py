@@ -1,5 +1,7 @@
 """QueryManager methods are intended to do "table-wide" things.
 """
+from datetime import datetime as DateTime
+
 from . import models
 
 
@@ -15,6 +17,30 @@ def _prepare_record_values(model, row):
     return data
 
 
+def _get_record_values(record):
+    """Get values of record fields, which can be passed to Model instance init.
+    """
+    data = {}
+    for field in record._meta.fields.values():
+        field_name = field.name
+        if isinstance(field, model_fields.RelatedRecordField):
+            field_name = field._name
+        data[field_name] = getattr(record, field_name)
+    return data
+
+
+def _create_record(db, model, data, identity_map):
+    """Create a record from fetched values, or take the already loaded one from the identity map.
+    """
+    if identity_map is None:
+        return model(db, **data)
+    key = (model, data['id'])
+    record = identity_map.get(key)
+    if record is None:
+        record = identity_map[key] = model(db, **data)
+    return record
+
+
 class QueryManager(models.ModelAttr):
     """Through this manager a Model interfaces with a database.
     """
@@ -38,14 +64,65 @@ class QueryManager(models.ModelAttr):
         record.save()
         return record
 
+    def bulk_create(self, db, records, batch_size=None):
+        """Insert many new records using multi-row INSERT queries. Unlike `Model.save()` no
+        signals are sent. If the db can tell ids of the inserted records, they are assigned to the
+        records.
+        @param db: db adapter to use
+        @param records: iterable of new records (Model instances) of this model
+        @param batch_size: max number of records inserted by one query
+        @return: list of the records
+        """
+        self.check_table(db)
+        model = self.model
+        records = list(records)
+        fields = list(model._meta.fields.values())
+        timestamp = DateTime.now()
+        rows = []
+        for record in records:
+            if not isinstance(record, model):
+                raise exceptions.RecordError('Pass records of model `%r`.' % model)
+            if record.id:
+                raise exceptions.RecordSaveError('Record %r is already saved.' % record)
+            record.timestamp = timestamp
+            row = []
+            for field in fields:
+                if isinstance(field, model_fields.RelatedRecordField):
+                    row.append(getattr(record, field._name))
+                else:
+                    row.append(getattr(record, field.name))
+            rows.append(row)
+        ids = db.insert_many(fields, rows, batch_size=batch_size)
+        db.commit()
+        if ids is not None:
+            for record, id in zip(records, ids):
+                record.id = id
+        return records
+
     def get_one(self, db, where=None, id=None, select_related=False):
         """Get a single record which falls under the given condition.
         @param db: db adapter to use to getting the record
         @param where: expression to use for filter
-        @param id: id of the record, if you want to fetch one record by its id
+        @param id: id of the record, if you want to fetch one record by its id; inside a
+            `db.session()` block a record which was already loaded is taken from the session,
+            records of models with `ModelOptions(cache=True)` are taken from their cache
         """
+        self.check_table(db)
+        record_cache = None
         if id:
-            where = (self.model.id == id)
+            model = self.model
+            identity_map = db._get_identity_map()
+            if identity_map is not None:
+                record = identity_map.get((model, id))
+                if record is not None:
+                    return record
+            record_cache = db._get_record_cache(model)
+            if record_cache is not None:
+                data = record_cache.get(db, id)
+                if data is not None:
+                    return _create_record(db, model, data, identity_map)
+                cache_version = record_cache.version
+            where = (model.id == id)
 
         records = list(self.model.objects.get(db, where, limit=2,
                                               select_related=select_related))
@@ -53,21 +130,155 @@ class QueryManager(models.ModelAttr):
             raise self.model.RecordNotFound(db.render(where))
         if len(records) > 1:
             raise self.model.MultipleRecordsFound
+        # records read in a transaction can be rolled back
+        if record_cache is not None and not db._local.transaction_depth and db.autocommit:
+            record_cache.add(db, id, _get_record_values(records[0]), cache_version)
         return records[0]
 
-    def get(self, db, where, orderby=False, limit=False, select_related=False):
+    def get(self, db, where, orderby=False, limit=False, select_related=False, prefetch=None):
         """Get records from this table which fall under the given condition.
         @param db: adapter to use
         @param where: condition to filter
         @param order: list of field to sort by
         @param limit: tuple (from, to)
         @param select_related: whether to retrieve objects related by foreign keys in the same query
+        @param prefetch: list of RelatedRecordFields of this model, whose related records to load
+            for all the records at once, see `load_related`
+        @return: generator of records; with an asyncio adapter - asynchronous generator
+        """
+        logger.debug(
+            "Model.objects.get('%s', db= %s, where= %s, limit= %s)", self.model, db, where, limit)
+        if isinstance(db, adapters.AsyncGenericAdapter):
+            if prefetch:
+                raise exceptions.QueryError('Prefetching is not supported by asyncio adapters.')
+            # asynchronous generator, for `async for`
+            return db._get_records(self, where, orderby, limit, select_related)
+        records = self._get(db, where, orderby, limit, select_related)
+        if prefetch:
+            return self._get_prefetched(db, records, prefetch)
+        return records
+
+    def _get_prefetched(self, db, records, fields):
+        yield from self.load_related(db, list(records), fields)
+
+    def load_related(self, db, records, fields):
+        """Load the records related to the given records by foreign keys with one query per
+        related model (per `db._MAX_QUERY_PARAMS` ids), instead of one query per record when the
+        related record attributes are accessed.
+        @param db: adapter to use
+        @param records: list of records of this model
+        @param fields: list of RelatedRecordFields of this model
+        @return: the records, with the related records assigned
         """
         model = self.model
+        identity_map = db._get_identity_map()
+        for field in fields:
+            if isinstance(field, model_fields.FieldExpression):
+                field = field.left
+            if not isinstance(field, model_fields.RelatedRecordField) or field.model is not model:
+                raise exceptions.QueryError('Pass related record fields of model `%r`.' % model)
+            attr_name = field._name
+            related_model = field.related_model
+            related_records = {}  # {id: related record}
+            ids = []
+            for record in records:
+                id = record.__dict__.get(attr_name)
+                if isinstance(id, int) and id not in related_records:
+                    related_records[id] = None
+                    if identity_map is not None:
+                        related_records[id] = identity_map.get((related_model, id))
+                    if related_records[id] is None:
+                        ids.append(id)
+            for start in range(0, len(ids), db._MAX_QUERY_PARAMS):
+                where = related_model.id.in_(*ids[start:start + db._MAX_QUERY_PARAMS])
+                for related_record in related_model.objects._get(db, where, False, False, False):
+                    related_records[related_record.id] = related_record
+            for record in records:
+                related_record = related_records.get(record.__dict__.get(attr_name))
+                # ids of missing records are left, to be reported when accessed
+                if related_record is not None:
+                    record.__dict__[attr_name] = related_record
+        return records
+
+    def iterate(self, db, where=None, orderby=False, limit=False, select_related=False,
+                batch_size=1000):
+        """Like `get`, but the records are fetched from the db in batches while being iterated,
+        so that memory use does not depend on the number of records. With PostgreSql iterate many
+        records inside a `db.transaction()` block, otherwise the server reads all of them first.
+        @param batch_size: number of rows fetched at once
+        """
         logger.debug(
-            "Model.objects.get('%s', db= %s, where= %s, limit= %s)", model, db, where, limit)
+            "Model.objects.iterate('%s', db= %s, where= %s, limit= %s)", self.model, db, where,
+            limit)
+        return self._get(db, where, orderby, limit, select_related, stream=True,
+                         batch_size=batch_size)
+
+    def iterate_batches(self, db, where=None, batch_size=1000, key=None, select_related=False,
+                        prefetch=None):
+        """Get records in batches using keyset pagination: each batch is selected with
+        `WHERE key > last_seen_key ORDER BY key LIMIT batch_size`, so unlike paging with OFFSET
+        the db does not skip the already seen rows.
+        @param db: adapter to use
+        @param where: condition to filter
+        @param batch_size: number of records in a batch
+        @param key: field or list of fields to order and page by, `-field` for descending order;
+            the key values must be unique and not NULL; by default `Model.id`
+        @param select_related: whether to retrieve objects related by foreign keys in the same query
+        @param prefetch: list of RelatedRecordFields, whose related records to load for each batch,
+            see `load_related`
+        @return: generator of lists of records
+        """
+        model = self.model
+        if key is None:
+            key = model.id
+        keys = list(key) if isinstance(key, (list, tuple)) else [key]
+        for _key in keys:
+            if not isinstance(_key, model_fields.FieldExpression) or _key.left.model is not model:
+                raise exceptions.QueryError('Pass fields of model `%r` as the key.' % model)
+        attr_names = [_key.left._name if isinstance(_key.left, model_fields.RelatedRecordField)
+                      else _key.left.name for _key in keys]
+
+        last_values = None
+        while True:
+            _where = where
+            if last_values is not None:
+                # (key1 > value1) OR (key1 = value1 AND key2 > value2) OR ...
+                condition = None
+                for i, (_key, value) in enumerate(zip(keys, last_values)):
+                    key_condition = (_key < value) if _key.sort == 'DESC' else (_key > value)
+                    for prev_key, prev_value in zip(keys[:i], last_values):
+                        key_condition = (prev_key == prev_value) & key_condition
+                    condition = key_condition if condition is None else condition | key_condition
+                _where = condition if where is None else where & condition
+            records = list(self._get(db, _where, keys, batch_size, select_related))
+            if records and prefetch:
+                self.load_related(db, records, prefetch)
+            if records:
+                yield records
+            if len(records) < batch_size:
+                break
+            last_values = [getattr(records[-1], attr_name) for attr_name in attr_names]
+
+    def _get(self, db, where, orderby, limit, select_related, stream=False, batch_size=1000):
+        """Generator of records from this table which fall under the given condition.
+        """
+        model = self.model
         self.check_table(db)
         orderby = orderby or model._meta.ordering  # use default table ordering if no ordering given
+        fields, from_, record_fields = self._get_select_args(select_related)
+        # retrieve the values from the DB
+        rows = db.select(*fields, from_=from_, where=where, orderby=orderby, limit=limit,
+                         stream=stream, batch_size=batch_size)
+        identity_map = db._get_identity_map()
+        for row in rows:
+            yield self._make_record(db, row, record_fields, identity_map)
+
+    def _get_select_args(self, select_related):
+        """Get what to select for getting records.
+        @return: tuple (fields, from_, record_fields), where record_fields is a list of
+            (field_no, RelatedRecordField) of the related records selected in the same query
+        """
+        model = self.model
         fields = list(model)
         from_ = [model]
         record_fields = []  # list of RelatedRecordField fields
@@ -80,37 +291,41 @@ class QueryManager(models.ModelAttr):
                     # left join
                     from_.append(models.LeftJoin(field.related_model,
                                                  on=(field_expression == field.related_model.id)))
+        return fields, from_, record_fields
 
-        # print(db._select(*fields, from_ = from_, where = where, orderby = orderby, limit = limit))
-        # retrieve the values from the DB
-        rows = db.select(*fields, from_=from_, where=where, orderby=orderby, limit=limit)
+    def _make_record(self, db, row, record_fields, identity_map=None):
+        """Create a record from selected values.
+        @param identity_map: {(model, id): record} of the records already loaded in the session
+        """
+        model = self.model
+        data = _prepare_record_values(model, row)
+        record = _create_record(db, model, data, identity_map)
 
-        for row in rows:
-            # create the record from the values
-            data = _prepare_record_values(model, row)
-            record = model(db, **data)
-
-            if select_related:
-                field_start = len(model)
-                for i, record_field in record_fields:
-                    related_model = record_field.related_model
-                    field_end = field_start + len(related_model)
-                    if row[i] is None:
-                        related_record = None
-                    else:
-                        # if related_record.id is None: # missing record !!! integrity error
-                        data = _prepare_record_values(related_model, row[field_start:field_end])
-                        related_record = related_model(db, **data)
-                    setattr(record, record_field.name, related_record)
-                    field_start = field_end
-            yield record
+        field_start = len(model)
+        for i, record_field in record_fields:
+            related_model = record_field.related_model
+            field_end = field_start + len(related_model)
+            if row[i] is None:
+                related_record = None
+            else:
+                # if related_record.id is None: # missing record !!! integrity error
+                data = _prepare_record_values(related_model, row[field_start:field_end])
+                related_record = _create_record(db, related_model, data, identity_map)
+            setattr(record, record_field.name, related_record)
+            field_start = field_end
+        return record
 
     def delete(self, db, where):
         """Delete records in the table which fall under the given condition.
         """
         self.check_table(db)
-        db.delete(self, where=where)
+        db.delete(self.model, where=where)
         db.commit()
+        identity_map = db._get_identity_map()
+        if identity_map is not None:
+            # the deleted records are not known
+            for key in [key for key in identity_map if key[0] is self.model]:
+                del identity_map[key]
 
     def get_count(self, db, where=None):
         """Request number of records in the table.
@@ -126,6 +341,10 @@ class QueryManager(models.ModelAttr):
         """Check if corresponding table for this model exists in the db and has all necessary
         columns. Add check_table call in very model method that uses a db.
         """
+        if isinstance(db, adapters.AsyncGenericAdapter):
+            raise exceptions.AdapterError(
+                'Asyncio adapters support only `Model.objects.get()`, records got through them are '
+                'read-only.')
         if not isinstance(db, adapters.GenericAdapter):
             raise exceptions.AdapterError('Need a database adapter.')
         if db.url in self._checked_dbs:
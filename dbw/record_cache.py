@@ -0,0 +1,80 @@
+"""
+Process-wide cache of records for lookups by id.
+"""
+import threading
+from collections import OrderedDict
+
+from . import signals
+
+
+class RecordCache():
+    """Thread-safe LRU cache of field values of records of a model, used by
+    `Model.objects.get_one(db, id=...)` when the model is declared with `ModelOptions(cache=True)`.
+    A record is dropped from the cache when it is saved or deleted, or changed by an UPDATE or a
+    DELETE query through an adapter. Changes made by raw queries or by other processes are not
+    noticed.
+    """
+    def __init__(self, model, max_size=1000):
+        """
+        @param model: model whose records to cache
+        @param max_size: max number of cached records
+        """
+        self.model = model
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # incremented on each invalidation, so that records read before it are not cached
+        self.version = 0
+        self._records = OrderedDict()  # {(db_url, id): {attr_name: value}}, least recent first
+        self._lock = threading.Lock()
+        signals.post_save.connect(self._on_change, sender=model)
+        signals.post_delete.connect(self._on_change, sender=model)
+
+    def __len__(self):
+        return len(self._records)
+
+    def _on_change(self, record, **kwargs):
+        self.invalidate(record._db, [record.id])
+
+    def get(self, db, id):
+        """Get values of a record.
+        @param db: adapter through which the record is requested
+        @return: {attr_name: value}, or None if the record is not cached
+        """
+        key = (db.url, id)
+        with self._lock:
+            values = self._records.get(key)
+            if values is None:
+                self.misses += 1
+                return None
+            self._records.move_to_end(key)
+            self.hits += 1
+            return dict(values)
+
+    def add(self, db, id, values, version):
+        """Cache values of a record.
+        @param version: `version` of the cache before the record was read from the db; the
+            record is not cached if the cache was invalidated meanwhile
+        """
+        key = (db.url, id)
+        with self._lock:
+            if version != self.version:
+                return
+            self._records[key] = values
+            self._records.move_to_end(key)
+            if len(self._records) > self.max_size:
+                self._records.popitem(last=False)
+
+    def invalidate(self, db, ids=None):
+        """Drop records of a db.
+        @param ids: ids of the records; None - all records of the db
+        """
+        url = db.url
+        with self._lock:
+            self.version += 1
+            if ids is None:
+                for key in [key for key in self._records if key[0] == url]:
+                    del self._records[key]
+            else:
+                for id in ids:
+                    self._records.pop((url, id), None)
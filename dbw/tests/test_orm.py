@@ -4,6 +4,8 @@ Tests for DBW
 __author__ = 'Victor Varvariuc <victor.varvariuc@gmail.com>'
 
 import unittest
+from datetime import date as Date
+from decimal import Decimal
 
 import dbw
 
@@ -221,3 +223,96 @@ class TestExpressions(unittest.TestCase):
         self.assertEqual(str(TestModel2.field3.in_(1, 2)), "(test_model2.field3_id IN (1, 2))")
         self.assertEqual(str(TestModel2.field3.count()), "COUNT(test_model2.field3_id)")
         self.assertEqual(str(TestModel2.field3.like('%ed')), "(test_model2.field3_id LIKE '%ed')")
+
+    def test_query_params(self):
+
+        class TestModel1(dbw.Model):
+            field1 = dbw.IntegerField()
+            field2 = dbw.CharField(max_length=100)
+
+        db = dbw.generic_adapter
+        query, params = db._compile(db._update, TestModel1.field2("it's"),
+                                    where=((TestModel1.field1 > '5') & (TestModel1.field2 != None)))
+        self.assertEqual(query, 'UPDATE test_model1 SET field2= %s WHERE '
+                                '((test_model1.field1 > %s) AND (test_model1.field2 IS NOT NULL))')
+        # values are encoded for the column they are compared with
+        self.assertEqual(params, ["it's", 5])
+        # without binding values are put into the query
+        self.assertEqual(db._update(TestModel1.field2("it's"), where=(TestModel1.field1 > '5')),
+                         "UPDATE test_model1 SET field2= 'it''s' WHERE (test_model1.field1 > 5)")
+
+    def test_compiled_queries(self):
+
+        class TestModel1(dbw.Model):
+            field1 = dbw.IntegerField()
+            field2 = dbw.CharField(max_length=100)
+
+        db = dbw.GenericAdapter()
+        rows1 = db._compile_select(TestModel1.id, where=(TestModel1.field1.in_(1, 2)),
+                                   orderby=-TestModel1.field2, limit=10)
+        self.assertEqual(len(db._compiled_queries), 1)
+        # a query with the same structure, but with different values reuses the template
+        rows2 = db._compile_select(TestModel1.id, where=(TestModel1.field1.in_(3, '4')),
+                                   orderby=-TestModel1.field2, limit=10)
+        self.assertEqual(len(db._compiled_queries), 1)
+        self.assertEqual(rows1.query, rows2.query)
+        self.assertEqual(rows1.params, [1, 2])
+        self.assertEqual(rows2.params, [3, 4])
+        # so do the names and the decoders of the fields
+        self.assertIs(rows2._layout, rows1._layout)
+        # but not the names of the fields which contain values
+        rows1 = db._compile_select(TestModel1.field1 + 1, from_=TestModel1)
+        rows2 = db._compile_select(TestModel1.field1 + 2, from_=TestModel1)
+        self.assertEqual(rows2._fields_str, ('(test_model1.field1 + 2)',))
+        # these change the query structure
+        db._compile_select(TestModel1.id, where=(TestModel1.field1.in_(1, 2, 3)))
+        db._compile_select(TestModel1.id, where=(TestModel1.field2 == None))
+        db._compile_select(TestModel1.id, where=(TestModel1.field2 == 'a'), orderby=+TestModel1.id)
+        self.assertEqual(len(db._compiled_queries), 5)
+        rows = db._compile_select(TestModel1.id, where=(TestModel1.field2 == 'b'),
+                                  orderby=+TestModel1.id)
+        self.assertEqual(rows.query, 'SELECT test_model1.id FROM  test_model1 '
+                                     'WHERE (test_model1.field2 = %s) ORDER BY test_model1.id ASC')
+        self.assertEqual(rows.params, ['b'])
+
+    def test_rows_access(self):
+
+        class TestModel1(dbw.Model):
+            field1 = dbw.IntegerField()
+            field2 = dbw.CharField(max_length=100)
+
+        db = dbw.GenericAdapter()
+        count = TestModel1.field1.count()
+        rows = db._compile_select(TestModel1.field1, TestModel1.field2, count,
+                                  groupby=[TestModel1.field1, TestModel1.field2])
+        rows.values = [[1, 'a', 3], [2, 'b', 4]]
+        # model fields and the same expressions are found without rendering them
+        self.assertEqual(rows.value(1, TestModel1.field2), 'b')
+        self.assertEqual(rows.value(0, count), 3)
+        self.assertEqual(rows.value(1, TestModel1.field1.count()), 4)
+        self.assertEqual(rows.value(1, 0), 2)
+        self.assertEqual(rows.column(TestModel1.field1), [1, 2])
+        self.assertEqual(rows.columns(count, TestModel1.field2), [[3, 4], ['a', 'b']])
+        self.assertEqual(rows.columns(), [[1, 2], ['a', 'b'], [3, 4]])
+
+    def test_rows_decoding(self):
+
+        class TestModel1(dbw.Model):
+            field1 = dbw.DateField()
+            field2 = dbw.DecimalField(max_digits=10, decimal_places=2)
+            field3 = dbw.BooleanField()
+            field4 = dbw.IntegerField()
+
+        db = dbw.SqliteAdapter()
+        count = TestModel1.field4.count()
+        rows = db._compile_select(TestModel1.field1, TestModel1.field2, TestModel1.field3,
+                                  TestModel1.field4, count, groupby=TestModel1.field1)
+        # only the columns which need decoding have decoders
+        self.assertEqual([decoder is not None for decoder in rows._decoders],
+                         [True, True, True, False, False])
+        self.assertEqual(rows._decode_row((10957, 1234, 1, 5, 7)),
+                         [Date(2000, 1, 1), Decimal('12.34'), True, 5, 7])
+        self.assertEqual(rows._decode_row((None, None, None, None, 0)),
+                         [None, None, None, None, 0])
+        rows = db._compile_select(TestModel1.field4, count, groupby=TestModel1.field4)
+        self.assertEqual(rows._decode_row((5, 7)), [5, 7])
@@ -2,6 +2,8 @@ __author__ = 'Victor Varvariuc <victor.varvariuc@gmail.com>'
 
 import unittest
 import os
+import asyncio
+import threading
 from datetime import date as Date, datetime as DateTime
 from decimal import Decimal
 
@@ -247,3 +249,689 @@ class PostgresqlAdapterTest(unittest.TestCase):
         self.assertIsNone(book.id)
         # Book count
         self._check_count(db, Book, len(book_data) - 1)
+
+    def test_prepared_statements(self):
+
+        db = self.db
+        if not isinstance(db, dbw.PostgreSqlAdapter):
+            raise unittest.SkipTest('Prepared statements are used only by PostgreSql adapter.')
+
+        class Publisher(dbw.Model):
+            name = dbw.CharField(max_length=100)
+
+        for query in db.get_create_table_query(Publisher):
+            db.execute(query)
+        db.commit()
+
+        publisher = Publisher.objects.create(db, name='Free Software Foundation')
+        for _ in range(db.prepare_threshold + 1):
+            self.assertEqual(Publisher.objects.get_one(db, id=publisher.id).name,
+                             publisher.name)
+        query = db.get_last_query()[1]
+        prepared_statements = db._prepared_statements[db._get_connection()]
+        self.assertIn(query, prepared_statements)
+        cursor = db.execute('SELECT name FROM pg_prepared_statements')
+        self.assertIn((prepared_statements[query],), cursor.fetchall())
+
+        # the least recently used statement is deallocated
+        max_prepared_statements = db._MAX_PREPARED_STATEMENTS
+        db._MAX_PREPARED_STATEMENTS = len(prepared_statements)
+        try:
+            statement_name = next(iter(prepared_statements.values()))
+            for _ in range(db.prepare_threshold):
+                Publisher.objects.get_one(db, where=(Publisher.name == publisher.name))
+            cursor = db.execute('SELECT name FROM pg_prepared_statements')
+            self.assertNotIn((statement_name,), cursor.fetchall())
+        finally:
+            db._MAX_PREPARED_STATEMENTS = max_prepared_statements
+
+    def test_transactions(self):
+
+        db = self.db
+
+        class Shelf(dbw.Model):
+            name = dbw.CharField(max_length=100)
+
+        for query in db.get_create_table_query(Shelf):
+            db.execute(query)
+        db.commit()
+
+        with db.transaction():
+            Shelf.objects.create(db, name='A')
+            # a failed nested block is rolled back to its savepoint
+            try:
+                with db.transaction():
+                    Shelf.objects.create(db, name='B')
+                    raise ValueError
+            except ValueError:
+                pass
+            with db.transaction():
+                Shelf.objects.create(db, name='C')
+            self.assertRaises(dbw.AdapterError, db.rollback)
+        self._check_count(db, Shelf, 2)
+
+        # a failed block is rolled back entirely
+        try:
+            with db.transaction():
+                Shelf.objects.create(db, name='D')
+                with db.transaction():
+                    Shelf.objects.create(db, name='E')
+                raise ValueError
+        except ValueError:
+            pass
+        self._check_count(db, Shelf, 2)
+        self.assertEqual(sorted(shelf.name for shelf in Shelf.objects.get(db, None)), ['A', 'C'])
+
+        # a failed block is rolled back also when its first query is in a nested block
+        try:
+            with db.transaction():
+                with db.transaction():
+                    Shelf.objects.create(db, name='F')
+                raise ValueError
+        except ValueError:
+            pass
+        self._check_count(db, Shelf, 2)
+
+    def test_connection_pool(self):
+
+        class Visitor(dbw.Model):
+            name = dbw.CharField(max_length=100)
+
+        for query in self.db.get_create_table_query(Visitor):
+            self.db.execute(query)
+        self.db.commit()
+
+        db = self.db.__class__(self.db.url, pool_size=2, max_overflow=1)
+        with db.connection():
+            Visitor.objects.check_table(db)
+        connections = []
+        errors = []
+
+        def visit(i):
+            try:
+                with db.connection():
+                    connection = db._get_connection()
+                    Visitor.objects.create(db, name='Visitor %i' % i)
+                    # the thread uses the same connection during the block
+                    self.assertIs(db._get_connection(), connection)
+                    connections.append(connection)
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=visit, args=(i,)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(connections), 10)
+        # overflow connections are closed when returned
+        self.assertLessEqual(db._pool._count, 2)
+        self._check_count(db, Visitor, 10)
+        db.disconnect()
+
+    def test_insert_many(self):
+
+        db = self.db
+
+        class Reader(dbw.Model):
+            name = dbw.CharField(max_length=100)
+            birth_date = dbw.DateField()
+
+        for query in db.get_create_table_query(Reader):
+            db.execute(query)
+        db.commit()
+
+        rows = ((None, None, 'Reader %i' % i, Date(2000, 1, 1 + i % 28)) for i in range(250))
+        ids = db.insert_many(Reader, rows, batch_size=100)
+        self.assertEqual(len(ids), 250)
+        self._check_count(db, Reader, 250)
+        self.assertEqual(Reader.objects.get_one(db, id=ids[30]).name, 'Reader 30')
+        self.assertEqual(Reader.objects.get_one(db, id=ids[-1]).birth_date, Date(2000, 1, 26))
+
+        # number of query parameters is limited
+        self.assertIsNone(db.insert_many([Reader.name], (['Reader'] for _ in range(2000)),
+                                         get_ids=False))
+        self._check_count(db, Reader, 2250)
+
+        readers = Reader.objects.bulk_create(db, [Reader(db, name='Anne'), Reader(db, name='Bob')])
+        self.assertEqual(Reader.objects.get_one(db, id=readers[1].id).name, 'Bob')
+        self.assertIsInstance(readers[0].timestamp, DateTime)
+
+    def test_copy_from(self):
+
+        db = self.db
+        if not isinstance(db, dbw.PostgreSqlAdapter):
+            raise unittest.SkipTest('COPY is supported only by PostgreSql adapter.')
+
+        class Guest(dbw.Model):
+            name = dbw.CharField(max_length=100)
+            visit_date = dbw.DateField()
+            is_member = dbw.BooleanField()
+
+        for query in db.get_create_table_query(Guest):
+            db.execute(query)
+        db.commit()
+
+        rows = ((None, None, 'Guest\t%i\n\\' % i, Date(2000, 1, 1 + i % 28), i % 2 == 0)
+                for i in range(1000))
+        self.assertEqual(db.copy_from(Guest, rows, buffer_size=1000), 1000)
+        self._check_count(db, Guest, 1000)
+        guest = Guest.objects.get_one(db, where=(Guest.name == 'Guest\t999\n\\'))
+        self.assertEqual(guest.visit_date, Date(2000, 1, 20))
+        self.assertFalse(guest.is_member)
+
+        db.copy_from([Guest.name, Guest.is_member], [Guest(db, name='Anne', is_member=True)])
+        guest = Guest.objects.get_one(db, where=(Guest.name == 'Anne'))
+        self.assertTrue(guest.is_member)
+        self.assertIsNone(guest.visit_date)
+
+    def test_update_many(self):
+
+        db = self.db
+
+        class Product(dbw.Model):
+            name = dbw.CharField(max_length=100)
+            price = dbw.DecimalField(max_digits=10, decimal_places=2)
+            available_since = dbw.DateField()
+
+        for query in db.get_create_table_query(Product):
+            db.execute(query)
+        db.commit()
+
+        ids = db.insert_many([Product.name, Product.price],
+                             (['Product %i' % i, Decimal(i)] for i in range(300)))
+        if ids is None:
+            ids = [product.id for product in Product.objects.get(db, None)]
+
+        rows = ((id, Decimal(i) + Decimal('0.5'), Date(2000, 1, 1 + i % 28))
+                for i, id in enumerate(ids))
+        self.assertEqual(db.update_many(Product, [Product.price, Product.available_since], rows,
+                                        batch_size=70), 300)
+        product = Product.objects.get_one(db, id=ids[100])
+        self.assertEqual(product.price, Decimal('100.5'))
+        self.assertEqual(product.available_since, Date(2000, 1, 17))
+
+        self.assertEqual(db.update_many(Product, [Product.price], [('Product 5', Decimal(1))],
+                                        key=Product.name), 1)
+        product = Product.objects.get_one(db, where=(Product.name == 'Product 5'))
+        self.assertEqual(product.price, Decimal(1))
+
+    def test_upsert(self):
+
+        db = self.db
+
+        class Stock(dbw.Model):
+            sku = dbw.CharField(max_length=20)
+            warehouse = dbw.CharField(max_length=20)
+            quantity = dbw.IntegerField()
+
+            _meta = dbw.ModelOptions(
+                db_indexes=dbw.DbUnique(sku, warehouse),
+            )
+
+        for query in db.get_create_table_query(Stock):
+            db.execute(query)
+        db.commit()
+
+        def get_quantity(sku, warehouse):
+            return Stock.objects.get_one(
+                db, where=(Stock.sku == sku) & (Stock.warehouse == warehouse)).quantity
+
+        id = db.upsert(Stock.sku('A1'), Stock.warehouse('North'), Stock.quantity(5))
+        _id = db.upsert(Stock.sku('A1'), Stock.warehouse('North'), Stock.quantity(7),
+                        conflict=[Stock.sku, Stock.warehouse])
+        self.assertEqual(id, _id)
+        self.assertEqual(get_quantity('A1', 'North'), 7)
+        # nothing to update
+        db.upsert(Stock.sku('A1'), Stock.warehouse('North'), Stock.quantity(9), update=[])
+        self.assertEqual(get_quantity('A1', 'North'), 7)
+        with self.assertRaises(dbw.QueryError):
+            db.upsert(Stock.sku('A1'), Stock.quantity(9), conflict=Stock.sku)
+
+        rows = [(None, None, 'A%i' % i, warehouse, i)
+                for i in range(100) for warehouse in ('North', 'South')]
+        db.upsert_many(Stock, rows, update=[(Stock.quantity, 0)], batch_size=30)
+        self._check_count(db, Stock, 200)
+        self.assertEqual(get_quantity('A1', 'North'), 0)
+        self.assertEqual(get_quantity('A1', 'South'), 1)
+
+    def test_streaming(self):
+
+        db = self.db
+
+        class Event(dbw.Model):
+            name = dbw.CharField(max_length=100)
+            happened_at = dbw.DateTimeField()
+
+        for query in db.get_create_table_query(Event):
+            db.execute(query)
+        db.commit()
+
+        db.insert_many([Event.name, Event.happened_at],
+                       (['Event %i' % i, DateTime(2000, 1, 1, i % 24)] for i in range(250)))
+
+        rows = db.select(Event.name, Event.happened_at, from_=Event, orderby=Event.id,
+                         stream=True, batch_size=100)
+        self.assertIsInstance(rows, dbw.StreamingRows)
+        values = list(rows)
+        self.assertEqual(len(values), 250)
+        self.assertEqual(values[-1], ['Event 249', DateTime(2000, 1, 1, 9)])
+        with self.assertRaises(dbw.QueryError):
+            list(rows)
+
+        events = Event.objects.iterate(db, Event.name.like('Event 1%'), orderby=Event.id,
+                                       batch_size=7)
+        self.assertEqual([event.name for event in events][:3], ['Event 1', 'Event 10', 'Event 11'])
+
+    def test_server_side_cursors(self):
+
+        db = self.db
+        if not isinstance(db, dbw.PostgreSqlAdapter):
+            raise unittest.SkipTest('Named cursors are used only by PostgreSql adapter.')
+
+        class Reading(dbw.Model):
+            value = dbw.IntegerField()
+
+        for query in db.get_create_table_query(Reading):
+            db.execute(query)
+        db.commit()
+        db.insert_many([Reading.value], ([i] for i in range(100)), get_ids=False)
+
+        # outside of a transaction the cursor survives commits of other queries
+        rows = db.select(Reading.value, from_=Reading, orderby=Reading.value, stream=True,
+                         batch_size=30)
+        self.assertIsNotNone(rows._cursor.name)
+        values = []
+        for row in rows:
+            values.append(row[0])
+            if len(values) == 50:
+                db.insert(Reading.value(100))
+        self.assertEqual(values, list(range(100)))
+        # closing the cursor does not leave a transaction open
+        self.assertEqual(db._get_connection().get_transaction_status(),
+                         db.driver.extensions.TRANSACTION_STATUS_IDLE)
+
+        with db.transaction():
+            readings = Reading.objects.iterate(db, Reading.value >= 90, batch_size=3)
+            self.assertEqual(sum(reading.value for reading in readings), 1045)
+
+    def test_columnar(self):
+
+        db = self.db
+
+        class Sale(dbw.Model):
+            quantity = dbw.IntegerField()
+            amount = dbw.DecimalField(max_digits=10, decimal_places=2)
+            is_refund = dbw.BooleanField()
+            region = dbw.CharField(max_length=20)
+
+        for query in db.get_create_table_query(Sale):
+            db.execute(query)
+        db.commit()
+
+        db.insert_many([Sale.quantity, Sale.amount, Sale.is_refund, Sale.region],
+                       ([i, Decimal(i) / 4, i % 10 == 0, 'North' if i % 2 else None]
+                        for i in range(100)))
+        db.insert(Sale.amount(Decimal('1.25')))  # quantity and is_refund are NULL
+
+        rows = db.select(Sale.quantity, Sale.amount, Sale.is_refund, Sale.region, from_=Sale,
+                         where=(Sale.quantity != None), orderby=Sale.id, columnar=True)
+        self.assertIsInstance(rows, dbw.ColumnarRows)
+        self.assertEqual(len(rows), 100)
+        self.assertEqual(sum(rows.column(Sale.quantity)), 4950)
+        self.assertEqual(sum(rows.column(Sale.is_refund)), 10)
+        self.assertEqual(rows.column(Sale.amount)[3], Decimal('0.75'))
+        self.assertEqual(rows.value(3, Sale.region), 'North')
+        self.assertEqual(list(rows)[1], [1, Decimal('0.25'), False, 'North'])
+
+        rows = db.select(Sale.quantity, Sale.amount, from_=Sale, orderby=Sale.id,
+                         columnar='scaled')
+        self.assertEqual(rows.value(100, Sale.quantity), None)
+        self.assertEqual(sum(rows.column(Sale.quantity)[:100]), 4950)
+        if isinstance(db, dbw.SqliteAdapter):
+            self.assertEqual(rows.scales, {1: 2})
+            self.assertEqual(rows.value(100, Sale.amount), 125)
+        else:
+            self.assertEqual(rows.value(100, Sale.amount), Decimal('1.25'))
+
+    def test_stats(self):
+
+        db = self.db
+
+        class Invoice(dbw.Model):
+            number = dbw.IntegerField()
+
+        for query in db.get_create_table_query(Invoice):
+            db.execute(query)
+        db.commit()
+        db.stats(reset=True)
+
+        for i in range(5):
+            db.insert(Invoice.number(i))
+        db.select(Invoice.id, from_=Invoice, where=Invoice.number.in_(1, 2, 3))
+        db.select(Invoice.id, from_=Invoice, where=Invoice.number.in_(4, 5))
+        db.update(Invoice.number(Invoice.number + 1), where=(Invoice.number > 2))
+
+        stats = db.stats(reset=True)
+        self.assertEqual(len(stats['recent']), 8)
+        queries = {query['fingerprint']: query for query in stats['queries']}
+        select_stats = queries['SELECT invoice.id FROM invoice WHERE (invoice.number IN (...))']
+        self.assertEqual(select_stats['calls'], 2)
+        self.assertEqual(select_stats['rows'], 4)
+        self.assertEqual(sum(count for _, count in select_stats['histogram']), 2)
+        self.assertLessEqual(select_stats['min_time'], select_stats['max_time'])
+        update_stats = queries['UPDATE invoice SET number= (invoice.number + ?) '
+                               'WHERE (invoice.number > ?)']
+        self.assertEqual(update_stats['rows'], 2)
+        self.assertEqual(db.stats(), {'queries': [], 'recent': []})
+        # rows of a query streamed after the reset are not accounted
+        rows = db.select(Invoice.id, from_=Invoice, stream=True)
+        db.stats(reset=True)
+        self.assertEqual(len(list(rows)), 5)
+        self.assertEqual(db.stats()['queries'], [])
+
+    def test_result_cache(self):
+
+        db = self.db
+
+        class Currency(dbw.Model):
+            code = dbw.CharField(max_length=3)
+
+        class Rate(dbw.Model):
+            value = dbw.IntegerField()
+
+        for model in (Currency, Rate):
+            for query in db.get_create_table_query(model):
+                db.execute(query)
+        db.commit()
+        db.insert(Currency.code('EUR'))
+        db.insert(Rate.value(1))
+
+        db.result_cache = dbw.ResultCache(max_entries=2)
+        try:
+            for _ in range(3):
+                self.assertEqual(db.select(Currency.code).column(0), ['EUR'])
+            db.select(Rate.value)
+            self.assertEqual((db.result_cache.hits, db.result_cache.misses), (2, 2))
+            # writes drop the results read from the changed table only
+            db.insert(Currency.code('USD'))
+            db.select(Rate.value)
+            self.assertEqual(db.result_cache.hits, 3)
+            self.assertEqual(db.select(Currency.code).column(0), ['EUR', 'USD'])
+            db.execute("UPDATE currency SET code = 'GBP' WHERE code = 'USD'")
+            self.assertEqual(db.select(Currency.code).column(0), ['EUR', 'GBP'])
+            self.assertEqual(db.select(Currency.code, cache=False).column(0), ['EUR', 'GBP'])
+            with db.transaction():
+                db.delete(Currency, where=(Currency.code == 'GBP'))
+                self.assertEqual(db.select(Currency.code).column(0), ['EUR'])
+            self.assertEqual(db.select(Currency.code).column(0), ['EUR'])
+            db.select(Currency.id)
+            self.assertEqual(len(db.result_cache), 2)
+            # the callers get copies of the cached rows
+            db.select(Currency.code).values[0][0] = 'XXX'
+            self.assertEqual(db.select(Currency.code).column(0), ['EUR'])
+            # results of queries with subqueries, which can read any tables, are not cached
+            hits = db.result_cache.hits
+            for _ in range(2):
+                db.select(Currency.code, where='currency.id IN (SELECT rate.value FROM rate)')
+            self.assertEqual(db.result_cache.hits, hits)
+        finally:
+            del db.result_cache
+
+    def test_identity_map(self):
+
+        db = self.db
+
+        class Customer(dbw.Model):
+            name = dbw.CharField(max_length=20)
+
+        class Purchase(dbw.Model):
+            customer = dbw.RelatedRecordField(Customer)
+
+        for model in (Customer, Purchase):
+            for query in db.get_create_table_query(model):
+                db.execute(query)
+        db.commit()
+
+        with db.session():
+            customer = Customer.objects.create(db, name='Anne')
+            for _ in range(3):
+                Purchase.objects.create(db, customer=customer)
+            db.stats(reset=True)
+            purchases = list(Purchase.objects.get(db, None))
+            self.assertTrue(all(purchase.customer is customer for purchase in purchases))
+            self.assertIs(Customer.objects.get_one(db, id=customer.id), customer)
+            self.assertIs(Customer.objects.get_one(db, where=(Customer.name == 'Anne')), customer)
+            self.assertIs(list(Purchase.objects.get(db, None))[1], purchases[1])
+            self.assertEqual(len(db.stats()['recent']), 3)  # only the selects
+            purchases[0].delete()
+            self.assertEqual(len(list(Purchase.objects.get(db, None))), 2)
+        # outside of a session records are loaded anew
+        self.assertIsNot(Customer.objects.get_one(db, id=customer.id), customer)
+
+    def test_record_cache(self):
+
+        db = self.db
+
+        class Nation(dbw.Model):
+            name = dbw.CharField(max_length=20)
+
+            _meta = dbw.ModelOptions(cache=True, cache_size=2)
+
+        for query in db.get_create_table_query(Nation):
+            db.execute(query)
+        db.commit()
+        ids = [Nation.objects.create(db, name=name).id for name in ('Chile', 'Peru', 'Cuba')]
+        record_cache = Nation._meta.record_cache
+
+        db.stats(reset=True)
+        for _ in range(3):
+            self.assertEqual(Nation.objects.get_one(db, id=ids[0]).name, 'Chile')
+        self.assertEqual(len(db.stats()['recent']), 1)
+        self.assertEqual(record_cache.hits, 2)
+        nation = Nation.objects.get_one(db, id=ids[0])
+        nation.name = 'Chili'
+        nation.save()
+        self.assertEqual(Nation.objects.get_one(db, id=ids[0]).name, 'Chili')
+        db.update(Nation.name('Chile'), where=(Nation.id == ids[0]))
+        self.assertEqual(Nation.objects.get_one(db, id=ids[0]).name, 'Chile')
+        for id in ids:
+            Nation.objects.get_one(db, id=id)
+        self.assertEqual(len(record_cache), 2)
+        db.update(Nation.name('Unknown'))
+        self.assertEqual(len(record_cache), 0)
+        Nation.objects.get_one(db, id=ids[1]).delete()
+        with self.assertRaises(Nation.RecordNotFound):
+            Nation.objects.get_one(db, id=ids[1])
+        # a record read before it was changed is not cached
+        version = record_cache.version
+        db.update(Nation.name('Kuba'), where=(Nation.id == ids[2]))
+        record_cache.add(db, ids[2], {'id': ids[2], 'timestamp': None, 'name': 'Cuba'}, version)
+        self.assertEqual(Nation.objects.get_one(db, id=ids[2]).name, 'Kuba')
+        # records cached by other threads during a transaction are dropped at commit
+        with db.transaction():
+            db.update(Nation.name('Cuba'), where=(Nation.id == ids[2]))
+            record_cache.add(db, ids[2], {'id': ids[2], 'timestamp': None, 'name': 'Kuba'},
+                             record_cache.version)
+        self.assertEqual(Nation.objects.get_one(db, id=ids[2]).name, 'Cuba')
+
+    def test_prefetch(self):
+
+        db = self.db
+
+        class Writer(dbw.Model):
+            name = dbw.CharField(max_length=20)
+
+        class Novel(dbw.Model):
+            writer = dbw.RelatedRecordField(Writer)
+
+        for model in (Writer, Novel):
+            for query in db.get_create_table_query(model):
+                db.execute(query)
+        db.commit()
+        writers = [Writer.objects.create(db, name='Writer %d' % i) for i in range(3)]
+        for i in range(6):
+            Novel.objects.create(db, writer=writers[i % 3])
+
+        db.stats(reset=True)
+        novels = list(Novel.objects.get(db, None, prefetch=[Novel.writer]))
+        self.assertEqual([novel.writer.name for novel in novels],
+                         ['Writer %d' % (i % 3) for i in range(6)])
+        self.assertEqual(len(db.stats()['recent']), 2)
+        self.assertIs(novels[0].writer, novels[3].writer)
+        batches = list(Novel.objects.iterate_batches(db, batch_size=4, prefetch=[Novel.writer]))
+        self.assertEqual([len(batch) for batch in batches], [4, 2])
+        self.assertEqual(batches[1][1].writer.name, 'Writer 2')
+        with self.assertRaises(dbw.QueryError):
+            list(Novel.objects.get(db, None, prefetch=[Writer.name]))
+
+    def test_sharded_sort(self):
+
+        db = self.db
+
+        class Score(dbw.Model):
+            value = dbw.IntegerField()
+
+        for query in db.get_create_table_query(Score):
+            db.execute(query)
+        db.commit()
+        for value in (3, None, 1, None, 2):
+            db.insert(Score.value(value))
+
+        # rows merged from shards are ordered like the db orders them
+        sharded_db = dbw.ShardedAdapter([db])
+        for orderby in (Score.value, -Score.value):
+            rows = db.select(Score.value, from_=Score)
+            values = list(rows.values)
+            sharded_db._sort(rows, values, orderby)
+            self.assertEqual(values, db.select(Score.value, orderby=orderby).values)
+
+    def test_slow_queries(self):
+
+        db = self.db
+
+        class Ticket(dbw.Model):
+            code = dbw.CharField(max_length=20)
+
+        for query in db.get_create_table_query(Ticket):
+            db.execute(query)
+        db.commit()
+
+        db.slow_query_time = 0
+        db.explain_slow_queries = True
+        try:
+            with self.assertLogs('dbw.slow_query', 'WARNING') as logs:
+                db.select(Ticket.id, from_=Ticket, where=(Ticket.code == 'A-1'))
+        finally:
+            del db.slow_query_time, db.explain_slow_queries
+        record = logs.records[-1]
+        self.assertIn('Slow query', record.getMessage())
+        self.assertEqual(record.params, ('A-1',))
+        self.assertIsNotNone(record.plan)
+
+    def test_explain(self):
+
+        db = self.db
+
+        class Passenger(dbw.Model):
+            passport = dbw.CharField(max_length=20)
+            name = dbw.CharField(max_length=100)
+
+            _meta = dbw.ModelOptions(
+                db_indexes=dbw.DbUnique(passport),
+            )
+
+        for query in db.get_create_table_query(Passenger):
+            db.execute(query)
+        db.commit()
+        if isinstance(db, dbw.PostgreSqlAdapter):
+            # the planner prefers scans of small tables
+            db.execute('SET enable_seqscan = off')
+
+        plan = db.explain(Passenger.name, where=(Passenger.passport == 'AB123'))
+        self.assertEqual(plan.tables, ['passenger'])
+        self.assertTrue(plan.uses_index(Passenger))
+        self.assertEqual(plan.full_scans, [])
+
+        plan = db.explain(Passenger.passport, where=(Passenger.name == 'Anne'))
+        self.assertFalse(plan.uses_index())
+        self.assertEqual([node.table for node in plan.full_scans], ['passenger'])
+        if isinstance(db, dbw.PostgreSqlAdapter):
+            # explaining outside of a transaction does not leave one open
+            self.assertEqual(db._get_connection().get_transaction_status(),
+                             db.driver.extensions.TRANSACTION_STATUS_IDLE)
+            db.execute('RESET enable_seqscan')
+
+    def test_iterate_batches(self):
+
+        db = self.db
+
+        class Entry(dbw.Model):
+            category = dbw.IntegerField()
+            title = dbw.CharField(max_length=20)
+
+        for query in db.get_create_table_query(Entry):
+            db.execute(query)
+        db.commit()
+        db.insert_many([Entry.category, Entry.title],
+                       ([i % 3, 'Entry %03i' % i] for i in range(25)), get_ids=False)
+
+        batches = list(Entry.objects.iterate_batches(db, batch_size=10))
+        self.assertEqual([len(batch) for batch in batches], [10, 10, 5])
+        ids = [entry.id for batch in batches for entry in batch]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), 25)
+
+        # composite key with descending order
+        batches = Entry.objects.iterate_batches(db, Entry.category != 1, batch_size=4,
+                                                key=[-Entry.category, Entry.title])
+        entries = [(entry.category, entry.title) for batch in batches for entry in batch]
+        self.assertEqual(len(entries), 17)
+        self.assertEqual(entries, sorted(entries, key=lambda entry: (-entry[0], entry[1])))
+        self.assertEqual(entries[0], (2, 'Entry 002'))
+
+    def test_async(self):
+
+        db = self.db
+
+        class Seat(dbw.Model):
+            number = dbw.IntegerField()
+            holder = dbw.CharField(max_length=20)
+
+        for query in db.get_create_table_query(Seat):
+            db.execute(query)
+        db.commit()
+
+        async def run():
+            try:
+                async_db = await dbw.connect_async(db.scheme + '://' + db.url)
+            except ImportError:
+                raise unittest.SkipTest('asyncpg is not installed.')
+            try:
+                ids = await asyncio.gather(*(
+                    async_db.insert(Seat.number(number), Seat.holder('Holder %i' % number))
+                    for number in range(5)))
+                self.assertEqual(len(set(ids)), 5)
+
+                with self.assertRaises(ZeroDivisionError):
+                    async with async_db.transaction():
+                        await async_db.delete(Seat, where=(Seat.number < 3))
+                        1 / 0
+                count = await async_db.update(Seat.holder('Nobody'), where=(Seat.number > 2))
+                self.assertEqual(count, 2)
+
+                seats = [seat async for seat in Seat.objects.get(
+                    async_db, None, orderby=Seat.number)]
+                self.assertEqual([seat.number for seat in seats], [0, 1, 2, 3, 4])
+                self.assertEqual(seats[-1].holder, 'Nobody')
+                # the records are read-only
+                with self.assertRaises(dbw.AdapterError):
+                    seats[0].save()
+                with self.assertRaises(dbw.AdapterError):
+                    Seat.objects.get_one(async_db, id=seats[0].id)
+            finally:
+                await async_db.disconnect()
+
+        asyncio.run(run())
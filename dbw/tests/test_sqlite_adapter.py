@@ -37,3 +37,94 @@ class SqliteAdapterTest(test_postgres_adapter.PostgresqlAdapterTest):
             ('publication_date', Date, int),
             ('is_popular', bool, int),
         )
+
+    def test_query_plan(self):
+
+        db = self.db
+        plan = db._parse_query_plan('SELECT 1', db._get_query_plan('SELECT 1', ()))
+        self.assertEqual(plan.nodes, [])
+        # reads of subquery results are not table reads
+        plan = db._parse_query_plan('', [
+            (1, 0, 0, 'MATERIALIZE sub'), (2, 1, 0, 'SCAN book'), (3, 0, 0, 'SCAN sub'),
+            (4, 0, 0, 'SCAN SUBQUERY 1'), (5, 0, 0, 'SEARCH author USING INTEGER PRIMARY KEY')])
+        self.assertEqual(plan.tables, ['book', 'author'])
+        self.assertEqual([node.table for node in plan.full_scans], ['book'])
+
+    def test_routing(self):
+
+        class Country(dbw.Model):
+            name = dbw.CharField(max_length=20)
+
+        # files standing in for the replicas, with rows telling which file was read
+        paths = [self.db.url + '.replica%i' % i for i in range(2)]
+        for path in paths:
+            open(path, 'w').close()
+        replicas = [dbw.connect('sqlite://' + path) for path in paths]
+        for i, replica in enumerate(replicas):
+            for query in replica.get_create_table_query(Country):
+                replica.execute(query)
+            replica.insert(Country.name('Replica %i' % i))
+        db = dbw.RoutingAdapter(self.db, replicas)
+        try:
+            for query in db.get_create_table_query(Country):
+                db.execute(query)
+            Country(db, name='Primary').save()
+
+            names = [Country.objects.get_one(db, where=(Country.id == 1)).name for _ in range(4)]
+            self.assertEqual(names, ['Replica 0', 'Replica 1'] * 2)
+            cursor = db.execute('SELECT name FROM country')
+            self.assertEqual(cursor.fetchall(), [('Replica 0',)])
+            # reads in a transaction see the writes made in it
+            with db.transaction():
+                db.update(Country.name('Updated'), where=(Country.id == 1))
+                self.assertEqual(db.select(Country.name).value(0, Country.name), 'Updated')
+            for replica in replicas:
+                self.assertEqual(replica.select(Country.count()).value(0, 0), 1)
+        finally:
+            for replica, path in zip(replicas, paths):
+                replica.disconnect()
+                os.remove(path)
+
+    def test_sharding(self):
+
+        class Event(dbw.Model):
+            user_id = dbw.IntegerField()
+            amount = dbw.IntegerField()
+
+            _meta = dbw.ModelOptions(shard_key=user_id)
+
+        paths = [self.db.url + '.shard%i' % i for i in range(3)]
+        for path in paths:
+            open(path, 'w').close()
+        # the shards are queried from the threads of the adapter
+        db = dbw.ShardedAdapter([dbw.connect('sqlite://' + path, check_same_thread=False)
+                                 for path in paths])
+        try:
+            for query in db.get_create_table_query(Event):
+                db.execute(query)
+            rows = [(user_id, user_id * 10 + i) for user_id in range(6) for i in range(2)]
+            ids = db.insert_many([Event.user_id, Event.amount], rows)
+            self.assertEqual(len(ids), 12)
+            for shard_no, shard in enumerate(db.shards):
+                user_ids = shard.select(Event.user_id, distinct=True).column(0)
+                self.assertEqual(sorted(user_ids), [shard_no, shard_no + 3])
+
+            rows = db.select(Event.user_id, Event.amount, orderby=-Event.amount, limit=(1, 3))
+            self.assertEqual(rows.values, [[5, 50], [4, 41], [4, 40]])
+            rows = db.select(Event.user_id, Event.count(), Event.amount.sum(), Event.amount.max(),
+                             where=(Event.user_id.in_(1, 2, 4)), groupby=Event.user_id,
+                             orderby=Event.user_id)
+            self.assertEqual(rows.values, [[1, 2, 21, 11], [2, 2, 41, 21], [4, 2, 81, 41]])
+            self.assertEqual(db.select(Event.amount.sum(), from_=Event).value(0, 0), 306)
+
+            event = Event.objects.get_one(db, where=(Event.user_id == 4) & (Event.amount == 40))
+            event.amount = 45
+            event.save()
+            self.assertEqual(db.update(Event.amount(0), where=(Event.user_id == 3)), 2)
+            event.delete()
+            self.assertEqual(db.select(Event.count()).value(0, 0), 11)
+            self.assertEqual(db.select(Event.count(), where=(Event.user_id == 4)).value(0, 0), 1)
+        finally:
+            db.disconnect()
+            for path in paths:
+                os.remove(path)
@@ -3,10 +3,10 @@
 import sys
 
 
-PYTHON_REQUIRED_VERSION = '3.3'
-if sys.version < PYTHON_REQUIRED_VERSION:
+PYTHON_REQUIRED_VERSION = (3, 7)
+if sys.version_info < PYTHON_REQUIRED_VERSION:
     sys.exit('Python %s or newer required (you are using: %s).'
-             % (PYTHON_REQUIRED_VERSION, sys.version))
+             % ('.'.join(map(str, PYTHON_REQUIRED_VERSION)), sys.version))
 
 
 import re
@@ -33,6 +33,7 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     include_package_data=True,  # install as package data files mentioned in MANIFEST.in
     zip_safe=False,
+    python_requires='>=3.7',
     license='BSD',
     classifiers=(
         'Development Status :: 4 - Beta',
@@ -41,7 +42,7 @@ setuptools.setup(
         'Topic :: Database',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 3.3',
+        'Programming Language :: Python :: 3.7',
         'Topic :: Software Development :: Libraries :: Application Frameworks',
         'Topic :: Software Development :: Libraries :: Python Modules',
     ),